@@ -0,0 +1,233 @@
+import asyncio
+from collections import deque
+from typing import Callable, Optional
+from ashpdu import ashpdu
+from shmessage import shmessage, WAVEREQ, BINARY, RID, SYNC_KEYS
+
+PUSHES = (WAVEREQ.CHAT, WAVEREQ.STRT, WAVEREQ.CARD, WAVEREQ.CLUE, WAVEREQ.SCRB, WAVEREQ.ENDG)
+
+
+class Stream:
+    def __init__(self, client: "AsyncClient", types):
+        self.types = types
+        self.queue = asyncio.Queue()
+        self._client = client
+        client._streams.append(self)
+        if client.finished or (client.closed and client.token is None):
+            self.queue.put_nowait(None)
+
+    def __aiter__(self) -> "Stream":
+        return self
+
+    async def __anext__(self) -> shmessage:
+        m = await self.queue.get()
+        if m is None:
+            self.queue.put_nowait(None)
+            raise StopAsyncIteration
+        return m
+
+    def close(self):
+        if self in self._client._streams:
+            self._client._streams.remove(self)
+        self.queue.put_nowait(None)
+
+
+class AsyncClient:
+    def __init__(self, username: str):
+        self.username = username
+        self.game_id = None
+        self.token = None
+        self.received = 0
+        self.pdusock = None
+        self.closed = True
+        self.finished = False
+        self.state = {}
+        self.epoch = None
+        self.version = None
+        self.correlate = False
+        self._rid = 0
+        self._replies = {}
+        self._waiters = deque()
+        self._streams = []
+        self._reader = None
+
+    @classmethod
+    async def connect(cls, host: str, port: int, username: str, codec: str = BINARY) -> "AsyncClient":
+        client = cls(username)
+        await client._open(host, port, codec)
+        return client
+
+    async def _open(self, host: str, port: int, codec: str):
+        reader, writer = await asyncio.open_connection(host, port)
+        self.pdusock = ashpdu(reader, writer)
+        self.closed = False
+        self.correlate = False
+        self._reader = asyncio.ensure_future(self._recvLoop())
+        reply = await self.request(WAVEREQ.HELO, WAVEREQ.HELO, codec=codec, rid="0")
+        self.pdusock.codec = reply.getValue("codec")
+        self.correlate = reply.getValue(RID) == "0"
+
+    async def reconnect(self, host: str, port: int, codec: str = BINARY) -> shmessage:
+        # Rebinds to the same player with RSUM; pushes missed while away arrive on the open streams.
+        if not self.closed:
+            self.pdusock.abort()
+            await asyncio.gather(self._reader, return_exceptions=True)
+        await self._open(host, port, codec)
+        m = await self.request(WAVEREQ.RSUM, WAVEREQ.RSUM, game_id=self.game_id, token=self.token,
+                               received=self.received)
+        if m.getValue("gap") == "1":
+            self.received = 0
+        return m
+
+    async def _recvLoop(self):
+        error = None
+        try:
+            while True:
+                m = await self.pdusock.recvMessage()
+                if m.getType() == WAVEREQ.PING and m.getValue("pong") is None:
+                    self.send(WAVEREQ.PING, pong=1)
+                    continue
+                if m.getType() in (WAVEREQ.CRE8, WAVEREQ.JOIN) and m.getValue("token") is not None:
+                    self.token = m.getValue("token")
+                    self.received = 0
+                if self.token is not None and m.getType() not in (WAVEREQ.HELO, WAVEREQ.RSUM, WAVEREQ.PING):
+                    self.received += 1
+                if not self._resolve(m):
+                    for stream in self._streams:
+                        if m.getType() in stream.types:
+                            stream.queue.put_nowait(m)
+        except Exception as e:
+            error = e
+        finally:
+            self.closed = True
+            for fut in [fut for _, _, fut in self._waiters] + list(self._replies.values()):
+                if not fut.done():
+                    fut.set_exception(ConnectionResetError(f"{self.username}: {error!r}"))
+            self._waiters.clear()
+            self._replies.clear()
+            if self.token is None:
+                self._end_streams()
+
+    def _end_streams(self):
+        for stream in self._streams:
+            stream.queue.put_nowait(None)
+
+    def _resolve(self, m: shmessage) -> bool:
+        # Replies carrying a rid go straight to their request, in any order. Without one they go to
+        # the oldest outstanding request that accepts them; anything else is a push.
+        fut = self._replies.pop(m.getValue(RID), None)
+        if fut is not None:
+            if not fut.done():
+                fut.set_result(m)
+            return True
+        for i, (t, match, fut) in enumerate(self._waiters):
+            if m.getType() == t and (match is None or match(m)):
+                del self._waiters[i]
+                if not fut.done():
+                    fut.set_result(m)
+                return True
+        return False
+
+    def send(self, t: WAVEREQ, **values):
+        if self.closed:
+            raise ConnectionResetError()
+        m = shmessage()
+        m.setType(t)
+        for k, v in values.items():
+            m.addValue(k, str(v))
+        self.pdusock.sendMessage(m)
+
+    def submit(self, t: WAVEREQ, reply: WAVEREQ, match: Optional[Callable[[shmessage], bool]] = None,
+               **values) -> "asyncio.Future[shmessage]":
+        fut = asyncio.get_running_loop().create_future()
+        if self.correlate:
+            self._rid += 1
+            rid = values[RID] = str(self._rid)
+            self._replies[rid] = fut
+        else:
+            self._waiters.append((reply, match, fut))
+        try:
+            self.send(t, **values)
+        except Exception:
+            if self.correlate:
+                del self._replies[rid]
+            else:
+                self._waiters.pop()
+            raise
+        return fut
+
+    async def request(self, t: WAVEREQ, reply: WAVEREQ, match=None, timeout: Optional[float] = None,
+                      **values) -> shmessage:
+        fut = self.submit(t, reply, match, **values)
+        await self.pdusock.drain()
+        return await asyncio.wait_for(fut, timeout)
+
+    def events(self, *types: WAVEREQ) -> Stream:
+        return Stream(self, types or PUSHES)
+
+    async def create(self, game_name: str, pin: str) -> shmessage:
+        m = await self.request(WAVEREQ.CRE8, WAVEREQ.CRE8, game_name=game_name, pin=pin, username=self.username)
+        self.game_id = m.getValue("game_id")
+        return m
+
+    async def join(self, game_name: str, pin: str) -> shmessage:
+        m = await self.request(WAVEREQ.JOIN, WAVEREQ.JOIN, game_name=game_name, pin=pin, username=self.username)
+        self.game_id = m.getValue("game_id")
+        return m
+
+    async def list_games(self) -> shmessage:
+        return await self.request(WAVEREQ.GLST, WAVEREQ.GLST)
+
+    async def chat(self, text: str) -> shmessage:
+        return await self.request(WAVEREQ.CHAT, WAVEREQ.CHAT, lambda m: m.getValue("from") == self.username,
+                                  game_id=self.game_id, username=self.username, text=text)
+
+    async def history(self, count: int = 20, before: Optional[int] = None) -> shmessage:
+        values = {"before": before} if before is not None else {}
+        return await self.request(WAVEREQ.HIST, WAVEREQ.HIST, game_id=self.game_id, count=count, **values)
+
+    async def sync(self) -> shmessage:
+        values = {"epoch": self.epoch, "since": self.version} if self.version is not None else {}
+        m = await self.request(WAVEREQ.SYNC, WAVEREQ.SYNC, game_id=self.game_id, **values)
+        if m.getValue("status") == "Success":
+            if m.getValue("mode") == "full":
+                self.state.clear()
+            self.state.update((k, m.getValue(k)) for k in SYNC_KEYS if m.getValue(k) is not None)
+            self.epoch = m.getValue("epoch")
+            self.version = int(m.getValue("version"))
+        return m
+
+    async def start(self) -> shmessage:
+        return await self.request(WAVEREQ.STRT, WAVEREQ.STRT, game_id=self.game_id)
+
+    async def draw(self) -> shmessage:
+        return await self.request(WAVEREQ.CARD, WAVEREQ.CARD, lambda m: m.getValue("topic") is not None,
+                                  game_id=self.game_id, username=self.username)
+
+    async def clue(self, clue: str) -> shmessage:
+        return await self.request(WAVEREQ.CLUE, WAVEREQ.CLUE, game_id=self.game_id, psychic=self.username, clue=clue)
+
+    async def guess(self, value: int) -> shmessage:
+        return await self.request(WAVEREQ.GUESS, WAVEREQ.SCRB, game_id=self.game_id, username=self.username,
+                                  value=value)
+
+    async def score(self) -> shmessage:
+        return await self.request(WAVEREQ.SCRB, WAVEREQ.SCRB, game_id=self.game_id)
+
+    async def ping(self) -> shmessage:
+        return await self.request(WAVEREQ.PING, WAVEREQ.PING, lambda m: m.getValue("pong") is not None)
+
+    async def stats(self) -> shmessage:
+        return await self.request(WAVEREQ.STAT, WAVEREQ.STAT)
+
+    async def close(self):
+        self.closed = True
+        self.finished = True
+        self._end_streams()
+        if self._reader is not None:
+            self._reader.cancel()
+            self.pdusock.close()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
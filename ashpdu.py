@@ -0,0 +1,72 @@
+import asyncio
+from typing import List, Tuple
+from shmessage import shmessage, TEXT
+
+
+class ashpdu:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec: str = TEXT):
+        self._reader = reader
+        self._writer = writer
+        self.codec = codec
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+    async def _loopRecv(self, size: int):
+        try:
+            data = await self._reader.readexactly(size)
+            self.bytes_in += size
+            return data
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError()
+
+
+    def encode(self, mess: shmessage) -> Tuple[bytes, bytes]:
+        return mess.frame(self.codec)
+
+
+    def sendFrames(self, frames: List[Tuple[bytes, bytes]]):
+        bufs = [buf for frame in frames for buf in frame]
+        self.bytes_out += sum(len(buf) for buf in bufs)
+        self._writer.writelines(bufs)
+
+
+    def sendFrame(self, frame: Tuple[bytes, bytes]):
+        self.bytes_out += len(frame[0]) + len(frame[1])
+        self._writer.writelines(frame)
+
+
+    def sendMessage(self, mess: shmessage):
+        self.sendFrame(self.encode(mess))
+
+
+    def sendMessages(self, messes: List[shmessage]):
+        self.sendFrames([self.encode(m) for m in messes])
+
+
+    async def drain(self):
+        await self._writer.drain()
+
+
+    async def recvMessage(self) -> shmessage:
+        try:
+            header = await self._loopRecv(4)
+            size = int.from_bytes(header, 'big')
+            payload = await self._loopRecv(size)
+
+            m = shmessage()
+            m.decode(payload, self.codec)
+            return m
+
+        except ConnectionResetError:
+            raise
+        except Exception as e:
+            raise Exception(f'Bad getMessage: {e}')
+
+
+    def abort(self):
+        self._writer.transport.abort()
+
+
+    def close(self):
+        self._writer.close()
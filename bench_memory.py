@@ -0,0 +1,39 @@
+import argparse
+import gc
+import tracemalloc
+from model import GameManager
+
+
+def populate(manager: GameManager, count: int):
+    for i in range(count):
+        game = manager.create_game(f"game{i}", "1234", f"p{i}a")
+        for suffix in "bcd":
+            manager.join_game(f"game{i}", "1234", f"p{i}{suffix}")
+        manager.start_game(game)
+        game.round_number = 1
+        game.assign_psychic()
+        game.draw_card()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure resident bytes per started 4-player game.")
+    parser.add_argument('--games', type=int, default=10000)
+    args = parser.parse_args()
+
+    manager = GameManager()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    populate(manager, args.games)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    per_game = (after - before) / args.games
+    print(f"games: {args.games}")
+    print(f"bytes per game: {per_game:.0f}")
+    print(f"projected for 100k games: {per_game * 100000 / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
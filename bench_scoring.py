@@ -0,0 +1,57 @@
+import argparse
+import random
+import time
+from scoring import DIAL, np, score_batch, score_guess
+
+
+def triples(count: int, seed: int):
+    rng = random.Random(seed)
+    guesses = [rng.randint(1, DIAL) for _ in range(count)]
+    starts = [rng.randint(1, DIAL) for _ in range(count)]
+    # Half the targets wrap around the end of the dial (start > end).
+    ends = [rng.randint(1, DIAL) if i % 2 else rng.randint(s, DIAL) for i, s in enumerate(starts)]
+    return guesses, starts, ends
+
+
+def check(guesses, starts, ends) -> int:
+    batch = score_batch(guesses, starts, ends)
+    mismatches = 0
+    for i, (g, s, e) in enumerate(zip(guesses, starts, ends)):
+        if score_guess(g, s, e)[0] != int(batch[i]):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"mismatch: guess={g} start={s} end={e} scalar={score_guess(g, s, e)[0]} batch={batch[i]}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scalar and batch guess scoring.")
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=470)
+    args = parser.parse_args()
+
+    guesses, starts, ends = triples(args.count, args.seed)
+    exhaustive = [(g, s, e) for g in range(-2, DIAL + 3) for s in range(1, DIAL + 1) for e in range(1, DIAL + 1)]
+    mismatches = check(*zip(*exhaustive)) + check(guesses, starts, ends)
+    print(f"equivalence: {len(exhaustive) + args.count} triples, {mismatches} mismatches")
+
+    started = time.perf_counter()
+    for g, s, e in zip(guesses, starts, ends):
+        score_guess(g, s, e)
+    scalar = time.perf_counter() - started
+
+    if np is not None:
+        guesses, starts, ends = np.array(guesses), np.array(starts), np.array(ends)
+    started = time.perf_counter()
+    score_batch(guesses, starts, ends)
+    batch = time.perf_counter() - started
+
+    print(f"scalar: {args.count / scalar:,.0f} guesses/s")
+    print(f"batch ({'numpy' if np is not None else 'no numpy, scalar fallback'}): {args.count / batch:,.0f} guesses/s")
+    print(f"speedup: {scalar / batch:.1f}x")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
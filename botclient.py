@@ -0,0 +1,109 @@
+import re
+import socket
+import time
+from collections import deque
+from typing import Callable, Optional, Tuple
+from shmessage import shmessage, WAVEREQ, BINARY, RID
+from shpdu import shpdu
+
+ROLES = re.compile(r"Psychic is (\S+), guesser is (\S+)")
+
+
+class BotClient:
+    def __init__(self, host: str, port: int, username: str, codec: str = BINARY, timeout: float = 30):
+        self.username = username
+        self.game_id = None
+        self.pending = deque()
+        self.rid = 0
+        self.correlate = False
+        sock = socket.create_connection((host, port))
+        sock.settimeout(timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.pdusock = shpdu(sock)
+        # A server that echoes the rid on HELO matches every reply to its request that way.
+        reply = self.request(WAVEREQ.HELO, WAVEREQ.HELO, codec=codec, rid="0")[0]
+        self.pdusock.codec = reply.getValue("codec")
+        self.correlate = reply.getValue(RID) == "0"
+
+    def send(self, t: WAVEREQ, **values) -> float:
+        m = shmessage()
+        m.setType(t)
+        for k, v in values.items():
+            m.addValue(k, str(v))
+        self.pdusock.sendMessage(m)
+        return time.perf_counter()
+
+    def _recv(self) -> shmessage:
+        while True:
+            m = self.pdusock.recvMessage()
+            if m.getType() != WAVEREQ.PING or m.getValue("pong") is not None:
+                return m
+            self.send(WAVEREQ.PING, pong=1)
+
+    def receive(self) -> shmessage:
+        return self.pending.popleft() if self.pending else self._recv()
+
+    def expect(self, t: Optional[WAVEREQ], match: Optional[Callable[[shmessage], bool]] = None) -> shmessage:
+        for i, m in enumerate(self.pending):
+            if (t is None or m.getType() == t) and (match is None or match(m)):
+                del self.pending[i]
+                return m
+        while True:
+            m = self._recv()
+            if (t is None or m.getType() == t) and (match is None or match(m)):
+                return m
+            self.pending.append(m)
+
+    def request(self, t: WAVEREQ, reply: WAVEREQ, match=None, **values) -> Tuple[shmessage, float]:
+        if self.correlate:
+            self.rid += 1
+            rid = values[RID] = str(self.rid)
+            sent = self.send(t, **values)
+            m = self.expect(None, lambda m: m.getValue(RID) == rid)
+        else:
+            sent = self.send(t, **values)
+            m = self.expect(reply, match)
+        return m, time.perf_counter() - sent
+
+    def create(self, game_name: str, pin: str) -> Tuple[shmessage, float]:
+        m, latency = self.request(WAVEREQ.CRE8, WAVEREQ.CRE8, game_name=game_name, pin=pin, username=self.username)
+        self.game_id = m.getValue("game_id")
+        return m, latency
+
+    def join(self, game_name: str, pin: str) -> Tuple[shmessage, float]:
+        m, latency = self.request(WAVEREQ.JOIN, WAVEREQ.JOIN, game_name=game_name, pin=pin, username=self.username)
+        self.game_id = m.getValue("game_id")
+        return m, latency
+
+    def list_games(self) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.GLST, WAVEREQ.GLST)
+
+    def chat(self, text: str) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.CHAT, WAVEREQ.CHAT, lambda m: m.getValue("from") == self.username,
+                            game_id=self.game_id, username=self.username, text=text)
+
+    def start(self) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.STRT, WAVEREQ.STRT, game_id=self.game_id)
+
+    def draw(self) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.CARD, WAVEREQ.CARD, lambda m: m.getValue("topic") is not None,
+                            game_id=self.game_id, username=self.username)
+
+    def clue(self, clue: str) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.CLUE, WAVEREQ.CLUE, game_id=self.game_id, psychic=self.username, clue=clue)
+
+    def guess(self, value: int) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.GUESS, WAVEREQ.SCRB, game_id=self.game_id, username=self.username, value=value)
+
+    def score(self) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.SCRB, WAVEREQ.SCRB, game_id=self.game_id)
+
+    def stats(self) -> Tuple[shmessage, float]:
+        return self.request(WAVEREQ.STAT, WAVEREQ.STAT)
+
+    def close(self):
+        self.pdusock.close()
+
+
+def roles(announcement: shmessage) -> Tuple[str, str]:
+    return ROLES.search(announcement.getValue("text")).groups()
@@ -1,3 +1,4 @@
+import queue
 import socket
 from shmessage import shmessage, WAVEREQ
 from shpdu import shpdu
@@ -5,13 +6,23 @@ import threading
 
 game_started = False
 
-def receive_loop(pdusock):
+def send_pong(pdusock):
+    pong = shmessage()
+    pong.setType(WAVEREQ.PING)
+    pong.addValue("pong", "1")
+    pdusock.sendMessage(pong)
+
+def receive_loop(pdusock, replies):
+    # Runs for the whole connection, so PINGs are answered even at the menu. Replies to the menu's
+    # requests go to the main thread; None tells it the connection is gone.
     global game_started
     while True:
         try:
             response = pdusock.recvMessage()
             t = response.getType()
-            if t == WAVEREQ.CHAT:
+            if t in (WAVEREQ.CRE8, WAVEREQ.JOIN, WAVEREQ.GLST):
+                replies.put(response)
+            elif t == WAVEREQ.CHAT:
                 print(f"\n[{response.getValue('from')}]: {response.getValue('text')}")
             elif t == WAVEREQ.STRT:
                 print(f"\n[GAME STATUS]: {response.getValue('text')}")
@@ -42,12 +53,19 @@ def receive_loop(pdusock):
                     val = response.getValue(k)
                     if val:
                         print(f"{k}: {val}")
+            elif t == WAVEREQ.HIST:
+                print("\nChat History")
+                for i in range(int(response.getValue("count") or 0)):
+                    print(f"[{response.getValue(f'from{i}')}]: {response.getValue(f'text{i}')}")
+            elif t == WAVEREQ.PING:
+                if response.getValue("pong") is None:
+                    send_pong(pdusock)
             elif t == WAVEREQ.ENDG:
                 print("\n Game Over")
                 print(f"Winner: {response.getValue('winner')}")
                 game_started = False
-                break
         except:
+            replies.put(None)
             break
 
 def main():
@@ -60,6 +78,8 @@ def main():
         with socket.socket() as s:
             s.connect((host, port))
             pdusock = shpdu(s)
+            replies = queue.Queue()
+            threading.Thread(target=receive_loop, args=(pdusock, replies), daemon=True).start()
 
             while True:
                 action = input("\nEnter request type (CRE8, JOIN, GLST, or EXIT): ").strip().upper()
@@ -68,7 +88,7 @@ def main():
                     print("Exiting client...")
                     return
 
-                if action not in WAVEREQ.__members__:
+                if action not in ("CRE8", "JOIN", "GLST"):
                     print("Invalid request type.")
                     continue
 
@@ -83,8 +103,15 @@ def main():
                 elif action == "GLST":
                     msg.setType(WAVEREQ.GLST)
 
-                pdusock.sendMessage(msg)
-                response = pdusock.recvMessage()
+                try:
+                    pdusock.sendMessage(msg)
+                except OSError:
+                    response = None
+                else:
+                    response = replies.get()
+                if response is None:
+                    print("Connection lost, reconnecting...")
+                    break
 
                 print("Response Type:", response.getType().name)
                 print("Status:", response.getValue("status"))
@@ -98,10 +125,9 @@ def main():
                     print("You've entered the game lobby. Type CHAT or STRT to begin.")
 
                     game_started = False
-                    threading.Thread(target=receive_loop, args=(pdusock,), daemon=True).start()
 
                     while not game_started:
-                        cmd = input("Enter pre-start command (CHAT, STRT, EXIT): ").strip().upper()
+                        cmd = input("Enter pre-start command (CHAT, HIST, STRT, EXIT): ").strip().upper()
                         if cmd == "EXIT":
                             return
                         elif cmd == "CHAT":
@@ -112,16 +138,21 @@ def main():
                             chat_msg.addValue("username", username)
                             chat_msg.addValue("text", text)
                             pdusock.sendMessage(chat_msg)
+                        elif cmd == "HIST":
+                            hist_msg = shmessage()
+                            hist_msg.setType(WAVEREQ.HIST)
+                            hist_msg.addValue("game_id", game_id)
+                            pdusock.sendMessage(hist_msg)
                         elif cmd == "STRT":
                             start_msg = shmessage()
                             start_msg.setType(WAVEREQ.STRT)
                             start_msg.addValue("game_id", game_id)
                             pdusock.sendMessage(start_msg)
                         else:
-                            print("Invalid command. Only CHAT, STRT, or EXIT allowed before game starts.")
+                            print("Invalid command. Only CHAT, HIST, STRT, or EXIT allowed before game starts.")
 
                     while game_started:
-                        cmd = input("Enter in-game command (CHAT, CARD, CLUE, GUESS, SCRB, ENDG, EXIT): ").strip().upper()
+                        cmd = input("Enter in-game command (CHAT, HIST, CARD, CLUE, GUESS, SCRB, ENDG, EXIT): ").strip().upper()
 
                         if cmd == "EXIT":
                             break
@@ -133,6 +164,11 @@ def main():
                             chat_msg.addValue("username", username)
                             chat_msg.addValue("text", text)
                             pdusock.sendMessage(chat_msg)
+                        elif cmd == "HIST":
+                            hist_msg = shmessage()
+                            hist_msg.setType(WAVEREQ.HIST)
+                            hist_msg.addValue("game_id", game_id)
+                            pdusock.sendMessage(hist_msg)
                         elif cmd == "CARD":
                             card_msg = shmessage()
                             card_msg.setType(WAVEREQ.CARD)
@@ -0,0 +1,211 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from typing import List
+import server
+from model import shard_of
+from shmessage import shmessage, WAVEREQ, CODECS, TEXT, RID
+from shpdu import shpdu
+from connection import Connection
+
+HANDOFF = b'C'
+LIST = b'L'
+MORE = b'+'
+LAST = b'.'
+CHANNEL_BUFSIZE = 1 << 18
+LIST_CHUNK = 1 << 16
+
+
+def send_chunked(chan: socket.socket, data: bytes):
+    # One SEQPACKET datagram must fit the socket buffer, so long replies go out in pieces.
+    for i in range(0, max(len(data), 1), LIST_CHUNK):
+        chunk = data[i:i + LIST_CHUNK]
+        chan.send((LAST if i + LIST_CHUNK >= len(data) else MORE) + chunk)
+
+
+def recv_chunked(chan: socket.socket) -> bytes:
+    parts = []
+    while True:
+        data = chan.recv(CHANNEL_BUFSIZE)
+        if not data:
+            raise ConnectionResetError("worker channel closed")
+        parts.append(data[1:])
+        if data[:1] == LAST:
+            return b''.join(parts)
+
+
+def pack_handoff(codec: str, prime: bytes) -> bytes:
+    return HANDOFF + json.dumps({"codec": codec}).encode('utf-8') + b'\n' + prime
+
+
+def unpack_handoff(data: bytes):
+    header, prime = data[1:].split(b'\n', 1)
+    return json.loads(header)["codec"], prime
+
+
+def serve_handoff(csoc: socket.socket, codec: str, prime: bytes, back: socket.socket):
+    # The front routes on the CRE8/JOIN still at the head of prime. If it fails the client is not ours:
+    # the reply goes out, then the socket and anything pipelined behind it go back to the front.
+    pdusock = shpdu(csoc, codec)
+    pdusock.feed(prime)
+    session = server.Session(Connection(pdusock, server.OUTBOX_SIZE, server.OUTBOX_POLICY))
+    try:
+        server.dispatch(session, session.conn.recvMessage())
+        if session.game is None:
+            session.conn.release()
+            socket.send_fds(back, [pack_handoff(pdusock.codec, pdusock.unread())], [csoc.fileno()])
+            csoc.close()
+            return
+    except Exception as e:
+        print(f"Client {session.username} error: {e!r}")
+        server.disconnect(session)
+        return
+    server.serve(session)
+
+
+def worker_main(index: int, count: int, chan: socket.socket, back: socket.socket, args,
+                inherited: List[socket.socket]):
+    # Drop the front's ends of every channel forked into us, so the front exiting reads as EOF here.
+    for s in inherited:
+        s.close()
+    server.configure(args)
+    server.game_manager.shard = (index, count)
+    server.start_services(args, os.path.join(args.wal_dir, f'worker{index}') if args.wal_dir else None)
+    server.timers.start()
+
+    while True:
+        data, fds, _, _ = socket.recv_fds(chan, CHANNEL_BUFSIZE, 1)
+        if not data:
+            return
+        if data[:1] == LIST:
+            send_chunked(chan, json.dumps(server.game_manager.list_games()).encode('utf-8'))
+        elif data[:1] == HANDOFF and fds:
+            codec, prime = unpack_handoff(data)
+            csoc = socket.socket(fileno=fds[0])
+            threading.Thread(target=serve_handoff, args=(csoc, codec, prime, back), daemon=True).start()
+
+
+class Worker:
+    def __init__(self, index: int, count: int, args, inherited: List[socket.socket]):
+        self.chan, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # Clients whose CRE8/JOIN failed come back from the worker on this one.
+        self.back, child_back = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.lock = threading.Lock()
+        self.process = multiprocessing.Process(target=worker_main, args=(index, count, child, child_back, args,
+                                                                         inherited + [self.chan, self.back]),
+                                               daemon=True)
+        self.process.start()
+        child.close()
+        child_back.close()
+
+    def handoff(self, csoc: socket.socket, codec: str, prime: bytes):
+        with self.lock:
+            socket.send_fds(self.chan, [pack_handoff(codec, prime)], [csoc.fileno()])
+
+    def returns(self, workers: List["Worker"]):
+        try:
+            while True:
+                data, fds, _, _ = socket.recv_fds(self.back, CHANNEL_BUFSIZE, 1)
+                if not data:
+                    return
+                codec, prime = unpack_handoff(data)
+                csoc = socket.socket(fileno=fds[0])
+                threading.Thread(target=route_client, args=(csoc, workers, codec, prime), daemon=True).start()
+        except OSError:
+            pass
+
+    def list_games(self) -> List[str]:
+        with self.lock:
+            self.chan.send(LIST)
+            return json.loads(recv_chunked(self.chan))
+
+    def stop(self):
+        self.chan.close()
+        self.back.close()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+def keepalive(csoc: socket.socket, idle: float):
+    # The front never PINGs, so a half-open peer is found by TCP keepalive: idle, then three probes.
+    csoc.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        csoc.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+        csoc.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(idle) // 3))
+        csoc.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+def route_client(csoc: socket.socket, workers: List[Worker], codec: str = TEXT, prime: bytes = b''):
+    if server.IDLE_TIMEOUT > 0:
+        keepalive(csoc, server.IDLE_TIMEOUT)
+    pdusock = shpdu(csoc, codec)
+    if prime:
+        pdusock.feed(prime)
+    try:
+        while True:
+            msg = pdusock.recvMessage()
+            req_type = msg.getType()
+            response = shmessage()
+            if msg.getValue(RID) is not None:
+                response.addValue(RID, msg.getValue(RID))
+
+            if req_type == WAVEREQ.HELO:
+                codec = msg.getValue("codec")
+                response.setType(WAVEREQ.HELO)
+                response.addValue("codec", codec if codec in CODECS else TEXT)
+                pdusock.sendMessage(response)
+                pdusock.codec = response.getValue("codec")
+                continue
+
+            if req_type == WAVEREQ.GLST:
+                games = [name for w in workers for name in w.list_games()]
+                response.setType(WAVEREQ.GLST)
+                response.addValue("status", "Success")
+                response.addValue("games", ", ".join(games) if games else "No available games")
+                pdusock.sendMessage(response)
+                continue
+
+            if req_type in (WAVEREQ.CRE8, WAVEREQ.JOIN):
+                key = msg.getValue("game_name") or ""
+            else:
+                key = msg.getValue("game_id")
+            if key is None:
+                response.setType(req_type)
+                response.addValue("status", "Failure")
+                response.addValue("reason", "Create or join a game first.")
+                pdusock.sendMessage(response)
+                continue
+
+            prime = b''.join(msg.frame(pdusock.codec)) + pdusock.unread()
+            workers[shard_of(key, len(workers))].handoff(csoc, pdusock.codec, prime)
+            return
+    except Exception:
+        pass
+    finally:
+        pdusock.close()
+
+
+def run_cluster(args):
+    workers = []
+    for i in range(args.workers):
+        workers.append(Worker(i, args.workers, args, [s for w in workers for s in (w.chan, w.back)]))
+    for w in workers:
+        threading.Thread(target=w.returns, args=(workers,), daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        with socket.socket() as s:
+            s.bind((server.HOST, args.port))
+            s.listen()
+            print(f"Server listening on {server.HOST}:{args.port} ({args.workers} workers)")
+            while True:
+                csoc, addr = s.accept()
+                print(f"Client connected from {addr}")
+                threading.Thread(target=route_client, args=(csoc, workers), daemon=True).start()
+    finally:
+        for w in workers:
+            w.stop()
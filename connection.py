@@ -0,0 +1,213 @@
+import asyncio
+import threading
+from collections import deque
+from typing import List, Optional
+from shmessage import shmessage, WAVEREQ
+
+DROP = 'drop'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP, COALESCE, DISCONNECT)
+# Pushes where a newer one makes the queued one obsolete; everything else is dropped under COALESCE.
+SUPERSEDING = (WAVEREQ.STRT, WAVEREQ.SCRB)
+
+
+class ReplayBuffer:
+    def __init__(self, maxsize: int):
+        self.sent = 0
+        self.lossy = False
+        self.messages = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+
+    def record(self, messes: List[shmessage]):
+        with self._lock:
+            self.messages.extend(messes)
+            self.sent += len(messes)
+
+    def since(self, received: int) -> Optional[List[shmessage]]:
+        # None when the client is missing more than the buffer still holds.
+        with self._lock:
+            missed = self.sent - received
+            if self.lossy or missed < 0 or missed > len(self.messages):
+                return None
+            return list(self.messages)[len(self.messages) - missed:]
+
+
+class ParkedConnection:
+    # Stands in for a dropped, resumable player: pushes are only recorded for replay.
+    def __init__(self, replay: ReplayBuffer):
+        self.replay = replay
+
+    def sendMessage(self, mess: shmessage):
+        self.replay.record([mess])
+
+    def sendMessages(self, messes: List[shmessage], record: bool = True, bounded: bool = True):
+        if record:
+            self.replay.record(messes)
+
+    def close(self):
+        pass
+
+
+class _Outbox:
+    def __init__(self, maxsize: int, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.replay = None
+        self._pending = deque()
+
+    def _offer(self, t, frame, bounded: bool = True) -> bool:
+        # Returns False when the consumer is too slow and must be disconnected.
+        if bounded and len(self._pending) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                return False
+            self.dropped += 1
+            if self.replay is not None:
+                self.replay.lossy = True
+            if self.policy == DROP or t not in SUPERSEDING:
+                return True
+            for i, (pt, _) in enumerate(self._pending):
+                if pt == t:
+                    del self._pending[i]
+                    break
+            else:
+                return True
+        self._pending.append((t, frame))
+        return True
+
+    def setCodec(self, codec: str):
+        self.pdusock.codec = codec
+
+
+class Connection(_Outbox):
+    def __init__(self, pdusock, maxsize: int = 256, policy: str = DROP):
+        super().__init__(maxsize, policy)
+        self.pdusock = pdusock
+        self._cond = threading.Condition()
+        self._writer = threading.Thread(target=self._drain, daemon=True)
+        self._writer.start()
+
+    def setCodec(self, codec: str):
+        with self._cond:
+            self.pdusock.codec = codec
+
+    def recvMessage(self) -> shmessage:
+        return self.pdusock.recvMessage()
+
+    def recvMessages(self) -> List[shmessage]:
+        return self.pdusock.recvMessages()
+
+    def sendMessage(self, mess: shmessage):
+        self.sendMessages([mess])
+
+    def sendMessages(self, messes: List[shmessage], record: bool = True, bounded: bool = True):
+        if record and self.replay is not None:
+            self.replay.record(messes)
+        with self._cond:
+            if self.closed:
+                raise ConnectionResetError()
+            # Encoded under the lock, so nothing encoded before a codec switch is queued after it.
+            for m in messes:
+                if not self._offer(m.getType(), self.pdusock.encode(m), bounded):
+                    self._abort()
+                    raise ConnectionResetError("Slow consumer disconnected")
+            self._cond.notify()
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return
+                frames = [frame for _, frame in self._pending]
+                self._pending.clear()
+            try:
+                self.pdusock.sendFrames(frames)
+            except Exception:
+                with self._cond:
+                    self._abort()
+                return
+
+    def _abort(self):
+        self.closed = True
+        self._pending.clear()
+        self._cond.notify()
+        self.pdusock.shutdown()
+
+    def expire(self):
+        # Wakes the reader blocked on this socket; its handler then runs the normal disconnect.
+        with self._cond:
+            if not self.closed:
+                self._abort()
+
+    def release(self):
+        # Stops the writer once everything queued is on the wire, leaving the socket open for another owner.
+        with self._cond:
+            self.closed = True
+            frames = [frame for _, frame in self._pending]
+            self._pending.clear()
+            self._cond.notify()
+        self._writer.join()
+        self.pdusock.sendFrames(frames)
+
+    def close(self):
+        with self._cond:
+            self._abort()
+        self.pdusock.close()
+
+
+class AsyncConnection(_Outbox):
+    def __init__(self, pdusock, maxsize: int = 256, policy: str = DROP):
+        super().__init__(maxsize, policy)
+        self.pdusock = pdusock
+        self._ready = asyncio.Event()
+        self._writer = asyncio.ensure_future(self._drain())
+
+    async def recvMessage(self) -> shmessage:
+        return await self.pdusock.recvMessage()
+
+    def sendMessage(self, mess: shmessage):
+        self.sendMessages([mess])
+
+    def sendMessages(self, messes: List[shmessage], record: bool = True, bounded: bool = True):
+        if record and self.replay is not None:
+            self.replay.record(messes)
+        if self.closed:
+            raise ConnectionResetError()
+        for m in messes:
+            if not self._offer(m.getType(), self.pdusock.encode(m), bounded):
+                self._abort()
+                raise ConnectionResetError("Slow consumer disconnected")
+        self._ready.set()
+
+    async def _drain(self):
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                frames = [frame for _, frame in self._pending]
+                self._pending.clear()
+                self.pdusock.sendFrames(frames)
+                await self.pdusock.drain()
+        except Exception:
+            self._abort()
+
+    def _abort(self):
+        self.closed = True
+        self._pending.clear()
+        self.pdusock.abort()
+
+    def expire(self):
+        if not self.closed:
+            self._abort()
+
+    def close(self):
+        self.closed = True
+        self._pending.clear()
+        self._writer.cancel()
+        self.pdusock.close()
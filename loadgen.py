@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from aclient import AsyncClient
+from botclient import BotClient, roles
+from shmessage import WAVEREQ, CODECS, BINARY
+
+PLAYERS = 4
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, t: WAVEREQ, latency: float):
+        with self.lock:
+            self.latencies[t.name].append(latency)
+
+    def report(self, elapsed: float) -> dict:
+        total = sum(len(v) for v in self.latencies.values())
+        per_type = {}
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            per_type[name] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "p999_ms": percentile(values, 0.999) * 1000
+            }
+        return {"requests": total, "elapsed_s": elapsed, "requests_per_s": total / elapsed if elapsed else 0.0,
+                "per_type": per_type}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def play_game(index: int, args, rec: Recorder):
+    name = f"load-{args.run_id}-{index}"
+    pin = str(random.randint(1000, 9999))
+    clients = [BotClient(args.host, args.port, f"{name}-p{i}", args.codec) for i in range(PLAYERS)]
+    by_name = {c.username: c for c in clients}
+    try:
+        _, latency = clients[0].create(name, pin)
+        rec.add(WAVEREQ.CRE8, latency)
+        for c in clients[1:]:
+            _, latency = c.join(name, pin)
+            rec.add(WAVEREQ.JOIN, latency)
+
+        for i in range(args.chat_burst):
+            _, latency = clients[i % PLAYERS].chat(f"msg {i}")
+            rec.add(WAVEREQ.CHAT, latency)
+        for i, c in enumerate(clients):
+            own = len(range(i, args.chat_burst, PLAYERS))
+            for _ in range(args.chat_burst - own):
+                c.expect(WAVEREQ.CHAT)
+
+        announce, latency = clients[0].start()
+        rec.add(WAVEREQ.STRT, latency)
+        for c in clients[1:]:
+            c.expect(WAVEREQ.STRT)
+
+        for _ in range(args.max_rounds):
+            psychic, guesser = (by_name[u] for u in roles(announce))
+            _, latency = psychic.draw()
+            rec.add(WAVEREQ.CARD, latency)
+            for c in clients:
+                if c is not psychic:
+                    c.expect(WAVEREQ.CARD)
+            psychic.expect(WAVEREQ.CARD, lambda m: m.getValue("target_start") is not None)
+
+            _, latency = psychic.clue("hint")
+            rec.add(WAVEREQ.CLUE, latency)
+            for c in clients:
+                if c is not psychic:
+                    c.expect(WAVEREQ.CLUE)
+
+            _, latency = guesser.guess(random.randint(1, 20))
+            rec.add(WAVEREQ.GUESS, latency)
+            for c in clients:
+                if c is not guesser:
+                    c.expect(WAVEREQ.SCRB)
+
+            nxt = [c.receive() for c in clients]
+            if nxt[0].getType() == WAVEREQ.ENDG:
+                break
+            announce = nxt[0]
+
+        _, latency = clients[0].score()
+        rec.add(WAVEREQ.SCRB, latency)
+    finally:
+        for c in clients:
+            c.close()
+
+
+async def play_game_async(index: int, args, rec: Recorder):
+    name = f"load-{args.run_id}-{index}"
+    pin = str(random.randint(1000, 9999))
+    clients = [await AsyncClient.connect(args.host, args.port, f"{name}-p{i}", args.codec) for i in range(PLAYERS)]
+    by_name = {c.username: c for c in clients}
+    rounds = clients[0].events(WAVEREQ.STRT, WAVEREQ.ENDG)
+    try:
+        started = time.perf_counter()
+        await clients[0].create(name, pin)
+        rec.add(WAVEREQ.CRE8, time.perf_counter() - started)
+        for c in clients[1:]:
+            started = time.perf_counter()
+            await c.join(name, pin)
+            rec.add(WAVEREQ.JOIN, time.perf_counter() - started)
+
+        # Chats are pipelined: every message is on the wire before the first echo is awaited.
+        started = time.perf_counter()
+        pending = [clients[i % PLAYERS].chat(f"msg {i}") for i in range(args.chat_burst)]
+        for _ in await asyncio.gather(*pending):
+            rec.add(WAVEREQ.CHAT, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        announce = await clients[0].start()
+        rec.add(WAVEREQ.STRT, time.perf_counter() - started)
+
+        for _ in range(args.max_rounds):
+            psychic, guesser = (by_name[u] for u in roles(announce))
+            for t, call in ((WAVEREQ.CARD, psychic.draw()), (WAVEREQ.CLUE, psychic.clue("hint")),
+                            (WAVEREQ.GUESS, guesser.guess(random.randint(1, 20)))):
+                started = time.perf_counter()
+                await call
+                rec.add(t, time.perf_counter() - started)
+            announce = await rounds.__anext__()
+            if announce.getType() == WAVEREQ.ENDG:
+                break
+
+        started = time.perf_counter()
+        await clients[0].score()
+        rec.add(WAVEREQ.SCRB, time.perf_counter() - started)
+    finally:
+        rounds.close()
+        for c in clients:
+            await c.close()
+
+
+async def run_async(args, rec: Recorder) -> int:
+    limit = asyncio.Semaphore(args.concurrency)
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with limit:
+            try:
+                await asyncio.wait_for(play_game_async(i, args, rec), 60)
+            except Exception as e:
+                failures += 1
+                if failures == 1:
+                    print(f"game failed: {e!r}")
+
+    await asyncio.gather(*(one(i) for i in range(args.games)))
+    return failures
+
+
+def compare(report: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        base = json.load(f)
+    print(f"\nvs {baseline_path}:")
+    print(f"  requests/s: {base['requests_per_s']:.0f} -> {report['requests_per_s']:.0f}")
+    for name, stats in report["per_type"].items():
+        old = base["per_type"].get(name)
+        if old:
+            print(f"  {name:6} p50 {old['p50_ms']:.2f} -> {stats['p50_ms']:.2f} ms, "
+                  f"p99 {old['p99_ms']:.2f} -> {stats['p99_ms']:.2f} ms")
+
+
+def server_stats(args, report: dict):
+    client = BotClient(args.host, args.port, f"load-{args.run_id}-stats", args.codec)
+    try:
+        m, _ = client.stats()
+    finally:
+        client.close()
+    if m.getValue("enabled") != "1":
+        print("server metrics are disabled; start it with --metrics")
+        return
+    print(f"{'type':6} {'server p50 us':>14} {'server p99 us':>14}")
+    for name in report["per_type"]:
+        p50, p99 = m.getValue(f"req.{name}.us.p50"), m.getValue(f"req.{name}.us.p99")
+        if p50 is not None:
+            print(f"{name:6} {p50:>14} {p99:>14}")
+            report["per_type"][name]["server_p50_us"] = int(p50)
+            report["per_type"][name]["server_p99_us"] = int(p99)
+    report["server_bytes_out"] = int(m.getValue("bytes_out") or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent 4-player games against a server.")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=50000)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100, help='games played at the same time')
+    parser.add_argument('--chat-burst', type=int, default=8)
+    parser.add_argument('--max-rounds', type=int, default=50)
+    parser.add_argument('--codec', choices=CODECS, default=BINARY)
+    parser.add_argument('--client', choices=['thread', 'async'], default='thread',
+                        help='one thread per game, or every game on one asyncio event loop')
+    parser.add_argument('--spawn', action='store_true', help='start a local server.py on --port for the run')
+    parser.add_argument('--server-args', default='',
+                        help='extra arguments for the spawned server, as one quoted string: --server-args "--metrics --workers 3"')
+    parser.add_argument('--server-pid', type=int, help='pid of the server, for memory per game')
+    parser.add_argument('--server-stats', action='store_true', help='fetch server-side latencies with STAT after the run')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='compare against results saved by an earlier run')
+    argv = sys.argv[1:]
+    # argparse will not take a value that looks like an option, so glue it on: --server-args=--metrics
+    if '--server-args' in argv[:-1]:
+        i = argv.index('--server-args')
+        argv[i:i + 2] = [f'--server-args={argv[i + 1]}']
+    args = parser.parse_args(argv)
+    args.run_id = f"{os.getpid()}-{int(time.time())}"
+
+    proc = None
+    if args.spawn:
+        here = os.path.dirname(os.path.abspath(__file__))
+        proc = subprocess.Popen([sys.executable, os.path.join(here, 'server.py'), '--port', str(args.port)]
+                                + shlex.split(args.server_args), stdout=subprocess.DEVNULL)
+        args.server_pid = proc.pid
+        time.sleep(1)
+
+    try:
+        rss_before = rss_bytes(args.server_pid) if args.server_pid else None
+        rec = Recorder()
+        failures = 0
+        started = time.perf_counter()
+        if args.client == 'async':
+            failures = asyncio.run(run_async(args, rec))
+        else:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                for future in [pool.submit(play_game, i, args, rec) for i in range(args.games)]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failures += 1
+                        if failures == 1:
+                            print(f"game failed: {e!r}")
+        report = rec.report(time.perf_counter() - started)
+        report["games"] = args.games
+        report["failures"] = failures
+        report["codec"] = args.codec
+        report["client"] = args.client
+        rss_after = rss_bytes(args.server_pid) if args.server_pid else None
+        if rss_before is not None and rss_after is not None:
+            report["server_bytes_per_game"] = (rss_after - rss_before) / args.games
+        if args.server_stats:
+            time.sleep(0.2)
+            server_stats(args, report)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    print(f"games: {args.games} ({failures} failed), requests: {report['requests']}, "
+          f"{report['requests_per_s']:.0f} req/s over {report['elapsed_s']:.1f}s")
+    print(f"{'type':6} {'count':>8} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8}")
+    for name, stats in report["per_type"].items():
+        print(f"{name:6} {stats['count']:>8} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['p999_ms']:>8.2f}")
+    if "server_bytes_per_game" in report:
+        print(f"server memory per game: {report['server_bytes_per_game']:.0f} bytes")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Dict
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        # Bucket i holds values in [2**(i-1), 2**i).
+        self.buckets[min(int(value).bit_length(), 63)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> int:
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return 1 << i
+        return 0
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.histograms: Dict[str, Histogram] = defaultdict(Histogram)
+        self.gauges: Dict[str, Callable[[], int]] = {}
+        self._lock = Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def gauge(self, name: str, fn: Callable[[], int]):
+        self.gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, str]:
+        out = {"enabled": "1" if self.enabled else "0"}
+        for name, fn in self.gauges.items():
+            out[name] = str(fn())
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                out[name] = str(value)
+            for name, h in sorted(self.histograms.items()):
+                out[f"{name}.count"] = str(h.count)
+                out[f"{name}.mean"] = f"{h.total / h.count:.1f}" if h.count else "0"
+                out[f"{name}.p50"] = str(h.quantile(0.5))
+                out[f"{name}.p99"] = str(h.quantile(0.99))
+                out[f"{name}.p999"] = str(h.quantile(0.999))
+        return out
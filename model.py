@@ -1,9 +1,14 @@
 import uuid
+import time
+import zlib
 from enum import Enum
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
-from threading import Lock
+from threading import Lock, RLock
 import random
+from array import array
+from scoring import center, score_guess
+from shmessage import SYNC_KEYS
 
 class WAVEREQ(Enum):
     CRE8 = 200
@@ -17,13 +22,137 @@ class WAVEREQ(Enum):
     ENDG = 210
     CHAT = 211
 
-@dataclass
+CARD_PAIRS = (
+    ("Hot", "Cold"), ("Safe for Work", "Not Safe for Work"), ("Genius", "Stupid"),
+    ("Overrated", "Underrated"), ("Moral", "Immoral"), ("Sweet", "Savory"),
+    ("Introvert", "Extrovert"), ("Realistic", "Fantastical"), ("Mainstream", "Obscure"),
+    ("Casual", "Formal"), ("Cheap", "Expensive"), ("Useful", "Useless"),
+    ("Healthy", "Unhealthy"), ("Modern", "Old-fashioned"), ("Funny", "Serious"),
+    ("Popular", "Unpopular"), ("Love", "Hate"), ("Hard", "Easy"), ("Necessary", "Unnecessary"),
+    ("Cool", "Uncool"), ("Brave", "Cowardly"), ("Messy", "Organized"), ("Cliché", "Original"),
+    ("Common", "Rare"), ("Quiet", "Loud"), ("Bright", "Dark"), ("Good for you", "Bad for you"),
+    ("Overprepared", "Underprepared"), ("Reliable", "Unreliable"), ("Predictable", "Surprising"),
+    ("Big Risk", "No Risk"), ("Fast", "Slow"), ("Public", "Private"), ("Generous", "Greedy"),
+    ("Fiction", "Nonfiction"), ("Simple", "Complicated"), ("Strong", "Weak"), ("Free", "Costly"),
+    ("Honest", "Deceptive"), ("Useful Skill", "Useless Skill"), ("Too Much", "Not Enough"),
+    ("Peaceful", "Chaotic"), ("Fun", "Boring"), ("Soft", "Hard"), ("Natural", "Artificial"),
+    ("Friendly", "Hostile"), ("Optimistic", "Pessimistic"), ("Efficient", "Wasteful"),
+    ("Energetic", "Tired"), ("Dangerous", "Safe"), ("Spicy", "Bland"), ("Big", "Small"),
+    ("Tall", "Wide"), ("Short", "Thin"), ("New", "Ancient"), ("Lame", "Exciting"),
+    ("Sweet", "Bitter"), ("Sour", "Tart"), ("Cool", "Hot"), ("Loud", "Silent"),
+    ("Shy", "Bold"), ("Fancy", "Simple"), ("Plain", "Luxury"), ("Cozy", "Uncomfortable"),
+    ("Icy", "Hot"), ("Grim", "Bright"), ("Happy", "Cheerful"), ("Sad", "Depressing"),
+    ("Dry", "Wet"), ("Weird", "Normal"), ("Basic", "Complex"), ("Creative", "Unimaginative"),
+    ("Grounded", "Flighty"), ("Polished", "Rough"), ("Clean", "Dirty"), ("Delicate", "Rugged"),
+    ("Orderly", "Chaotic"), ("Open-minded", "Close-minded"), ("Passive", "Aggressive"),
+    ("Playful", "Serious"), ("Logical", "Emotional"), ("Literal", "Figurative"),
+    ("Tidy", "Messy"), ("Overt", "Subtle"), ("Routine", "Spontaneous"), ("Hyped", "Chill"),
+    ("Innovative", "Traditional"), ("Digital", "Analog"), ("Organic", "Synthetic"),
+    ("Main Character", "Side Character"), ("Awkward", "Charming"), ("Extinct", "Thriving"),
+    ("Groundbreaking", "Typical"), ("High Effort", "Low Effort"), ("Popular", "Underground"),
+    ("Smart", "Ignorant"), ("Seasoned", "Inexperienced"), ("Overkill", "Underwhelming"),
+    ("Wild", "Tame"), ("Hopeful", "Hopeless"), ("Impressive", "Forgettable"),
+    ("Open", "Closed"), ("Massive", "Tiny"), ("Overconfident", "Insecure"),
+    ("Overdressed", "Underdressed"), ("Powerful", "Powerless"), ("Grounded", "Unrealistic"),
+    ("Bright", "Muted"), ("Talkative", "Quiet"), ("Controversial", "Uncontroversial"),
+    ("Nostalgic", "Futuristic"), ("Altruistic", "Selfish"), ("Cringe", "Cool"),
+    ("Rebellious", "Obedient"), ("Edgy", "Wholesome"), ("Dramatic", "Calm"),
+    ("Silly", "Serious"), ("Heavy", "Light"), ("Warm", "Cool"), ("Sharp", "Dull"),
+    ("Private", "Public"), ("Obvious", "Ambiguous"), ("Literal", "Metaphorical"),
+    ("Edible", "Inedible"), ("Human-made", "Natural"), ("Expected", "Unexpected"),
+    ("Traditional", "Modern"), ("Local", "Global"), ("Impersonal", "Personal"),
+    ("Forgiving", "Grudging"), ("Rigid", "Flexible"), ("Noisy", "Quiet"),
+    ("Urban", "Rural"), ("Safe", "Risky"), ("Imaginative", "Literal"),
+    ("Extravagant", "Minimal"), ("Crowded", "Empty"), ("Exclusive", "Inclusive"),
+    ("Active", "Passive"), ("Fancy", "Plain"), ("Slick", "Clunky"), ("Dense", "Sparse"),
+    ("Expressive", "Reserved"), ("Familiar", "Unfamiliar"), ("Approachable", "Intimidating"),
+    ("Bright", "Dim"), ("Physical", "Digital"), ("Popular", "Niche")
+)
+CARD_TOPICS = tuple(f"{l} vs {r}" for l, r in CARD_PAIRS)
+
+TEAMS = ("TeamA", "TeamB")
+
+class TeamPair:
+    __slots__ = TEAMS
+
+    def __init__(self, a=None, b=None):
+        self.TeamA = a
+        self.TeamB = b
+
+    def __getitem__(self, team: str):
+        return getattr(self, team)
+
+    def __setitem__(self, team: str, value):
+        setattr(self, team, value)
+
+    def __repr__(self) -> str:
+        return f"TeamPair(TeamA={self.TeamA!r}, TeamB={self.TeamB!r})"
+
+    def get(self, team: str, default=None):
+        value = getattr(self, team, None)
+        return default if value is None else value
+
+    def items(self):
+        return (("TeamA", self.TeamA), ("TeamB", self.TeamB))
+
+    def clear(self):
+        self.TeamA = None
+        self.TeamB = None
+
+CHAT_CAPACITY = 100
+
+_SYNC_INDEX = {key: i for i, key in enumerate(SYNC_KEYS)}
+_EVENT_KEYS = {event: tuple(_SYNC_INDEX[key] for key in keys) for event, keys in {
+    "create": SYNC_KEYS,
+    "join": ("players",),
+    "start": ("state", "team"),
+    "psychic": ("round", "psychic", "guesser"),
+    "draw": ("topic", "left", "right"),
+    "clue": ("clue",),
+    "guess": ("guess",),
+    "score": ("TeamA", "TeamB"),
+    "next_round": ("round", "team", "psychic", "guesser", "topic", "left", "right", "clue", "guess"),
+    "end": ("state",),
+    "evict": ("state",),
+}.items()}
+
+def shard_of(key: str, shards: int) -> int:
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+class ChatLog:
+    __slots__ = ("capacity", "next_seq", "_ring")
+
+    def __init__(self, capacity: int = CHAT_CAPACITY):
+        self.capacity = capacity
+        self.next_seq = 0
+        self._ring = None
+
+    def __len__(self) -> int:
+        return min(self.next_seq, self.capacity)
+
+    def append(self, sender: str, text: str) -> int:
+        if self._ring is None:
+            self._ring = [None] * self.capacity
+        seq = self.next_seq
+        self._ring[seq % self.capacity] = (sender, text)
+        self.next_seq = seq + 1
+        return seq
+
+    def page(self, count: int, before: Optional[int] = None) -> Tuple[int, List[Tuple[str, str]]]:
+        end = self.next_seq if before is None else max(0, min(before, self.next_seq))
+        start = max(end - count, self.next_seq - len(self), 0)
+        if start >= end:
+            return end, []
+        return start, [self._ring[seq % self.capacity] for seq in range(start, end)]
+
+@dataclass(slots=True)
 class Player:
     username: str
     team: str
     is_psychic: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class Card:
     topic: str
     left_hint: str
@@ -32,9 +161,9 @@ class Card:
     target_end: int
 
     def center(self):
-        return (self.target_start + self.target_end) // 2
+        return center(self.target_start, self.target_end)
 
-@dataclass
+@dataclass(slots=True)
 class Game:
     game_name: str
     pin: str
@@ -42,151 +171,272 @@ class Game:
     game_id: str = field(default_factory=lambda: str(uuid.uuid4())[:8])
     players: List[Player] = field(default_factory=list)
     state: str = "LOBBY"
-    cards: List[Card] = field(default_factory=list)
+    deck: array = field(default_factory=lambda: array('H'), repr=False)
+    deck_pos: int = 0
     current_card: Optional[Card] = None
     clue: Optional[str] = None
-    scores: Dict[str, int] = field(default_factory=lambda: {"TeamA": 0, "TeamB": 0})
-    guesses: Dict[str, int] = field(default_factory=dict)
-    chat_log: List[str] = field(default_factory=list)
+    scores: TeamPair = field(default_factory=lambda: TeamPair(0, 0))
+    guesses: TeamPair = field(default_factory=TeamPair)
+    chat_log: ChatLog = field(default_factory=ChatLog, repr=False)
     round_number: int = 0
     psychic_index: int = -1
+    guesser_index: int = -1
     current_team: str = "TeamA"
+    rosters: TeamPair = field(default_factory=TeamPair, repr=False, compare=False)
+    lock: RLock = field(default_factory=RLock, repr=False, compare=False)
+    last_activity: float = field(default_factory=time.monotonic, repr=False, compare=False)
+    ended_at: Optional[float] = field(default=None, repr=False, compare=False)
+    journal: Optional[Callable] = field(default=None, repr=False, compare=False)
+    lsn: int = field(default=0, repr=False, compare=False)
+    evicted: bool = field(default=False, repr=False, compare=False)
+    version: int = field(default=0, repr=False, compare=False)
+    changed: array = field(default_factory=lambda: array('I', bytes(4 * len(SYNC_KEYS))), repr=False, compare=False)
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def _record(self, event: str, **fields):
+        keys = _EVENT_KEYS.get(event)
+        if keys:
+            self.version += 1
+            for i in keys:
+                self.changed[i] = self.version
+        if self.journal is not None:
+            self.journal(self, event, fields)
 
     def add_player(self, username: str, team: str):
-        if self.state != "LOBBY":
-            raise Exception("Cannot join; game already started.")
-        self.players.append(Player(username=username, team=team))
+        with self.lock:
+            if self.state != "LOBBY":
+                raise Exception("Cannot join; game already started.")
+            self.players.append(Player(username=username, team=team))
+            self.touch()
+            self._record("join", username=username, team=team)
 
     def start_game(self):
-        if self.state != "LOBBY":
-            raise Exception("Game already started or ended.")
-        self.state = "IN_PROGRESS"
-        self.current_team = "TeamA"
+        with self.lock:
+            if self.state != "LOBBY":
+                raise Exception("Game already started or ended.")
+            self.state = "IN_PROGRESS"
+            self.current_team = "TeamA"
+            self._build_rosters()
+            self.touch()
+            self._record("start")
+
+    def _build_rosters(self):
+        # Indices into players, per team in join order; roles rotate through these.
+        self.rosters = TeamPair(*(tuple(i for i, p in enumerate(self.players) if p.team == team) for team in TEAMS))
+
+    def _set_psychic(self, index: int):
+        if 0 <= self.psychic_index < len(self.players):
+            self.players[self.psychic_index].is_psychic = False
+        self.psychic_index = index
+        self.players[index].is_psychic = True
+        roster = self.rosters[self.players[index].team]
+        self.guesser_index = roster[1] if roster[0] == index else roster[0]
 
     def assign_psychic(self):
-        for p in self.players:
-            p.is_psychic = False
-        if not self.players:
-            return None
-        eligible = [p for p in self.players if p.team == self.current_team]
-        self.psychic_index = self.players.index(eligible[self.round_number % len(eligible)])
-        self.players[self.psychic_index].is_psychic = True
-        return self.players[self.psychic_index].username
+        with self.lock:
+            if not self.players:
+                return None
+            roster = self.rosters[self.current_team]
+            self._set_psychic(roster[self.round_number % len(roster)])
+            self._record("psychic", round=self.round_number, index=self.psychic_index)
+            return self.players[self.psychic_index].username
+
+    def psychic(self) -> Optional[Player]:
+        return self.players[self.psychic_index] if self.psychic_index >= 0 else None
+
+    def guesser(self) -> Optional[Player]:
+        return self.players[self.guesser_index] if self.guesser_index >= 0 else None
+
+    def roster(self, team: str) -> List[Player]:
+        return [self.players[i] for i in self.rosters[team] or ()]
 
     def submit_clue(self, clue: str, psychic: str):
-        self.clue = clue
+        with self.lock:
+            self.clue = clue
+            self.touch()
+            self._record("clue", clue=clue)
+
+    def add_chat(self, sender: str, text: str) -> int:
+        with self.lock:
+            self.touch()
+            return self.chat_log.append(sender, text)
 
     def submit_guess(self, team: str, value: int):
-        if not (1 <= value <= 20):
-            raise ValueError("Guess must be an integer between 1 and 20.")
-        self.guesses[team] = value
+        with self.lock:
+            if not (1 <= value <= 20):
+                raise ValueError("Guess must be an integer between 1 and 20.")
+            self.guesses[team] = value
+            self.touch()
+            self._record("guess", team=team, value=value)
 
     def evaluate_guess(self):
-        psychic = self.players[self.psychic_index]
-        main_team = psychic.team
-        guess = self.guesses.get(main_team)
-        if guess is None or self.current_card is None:
-            return None
+        with self.lock:
+            psychic = self.players[self.psychic_index]
+            main_team = psychic.team
+            guess = self.guesses.get(main_team)
+            if guess is None or self.current_card is None:
+                return None
+
+            start = self.current_card.target_start
+            end = self.current_card.target_end
+            points, mid = score_guess(guess, start, end)
+
+            self.scores[main_team] += points
+            self._record("score", team=main_team, points=points)
+
+            return {
+                "team_guess": guess,
+                "target_range": f"{start} - {end}",
+                "target_center": mid,
+                "points": points,
+                "TeamA": self.scores["TeamA"],
+                "TeamB": self.scores["TeamB"]
+            }
 
-        start = self.current_card.target_start
-        end = self.current_card.target_end
-        center = self.current_card.center()
+    def next_round(self):
+        with self.lock:
+            self.round_number += 1
+            self.clue = None
+            self.current_card = None
+            self.guesses.clear()
+            self.current_team = "TeamB" if self.current_team == "TeamA" else "TeamA"
+            if self.psychic_index >= 0:
+                self.players[self.psychic_index].is_psychic = False
+            self.psychic_index = -1
+            self.guesser_index = -1
+            self.touch()
+            self._record("next_round")
 
-        if start <= end:
-            in_arc = start <= guess <= end
-        else:
-            in_arc = guess >= start or guess <= end
+    def draw_card(self) -> Optional[Card]:
+        with self.lock:
+            if self.deck_pos >= len(self.deck):
+                self.generate_default_cards()
+            if not self.deck:
+                return None
+            index = self.deck[self.deck_pos]
+            self.deck_pos += 1
+            left, right = CARD_PAIRS[index]
+            card = Card(CARD_TOPICS[index], left, right, random.randint(1, 15), random.randint(16, 20))
+            self.current_card = card
+            self.touch()
+            self._record("draw", index=index, start=card.target_start, end=card.target_end)
+            return card
 
-        if guess == center:
-            points = 4
-        elif in_arc:
-            points = 3
-        elif abs(guess - center) % 20 == 1:
-            points = 2
-        elif abs(guess - center) % 20 == 2:
-            points = 1
-        else:
-            points = 0
+    def generate_default_cards(self):
+        self.deck = array('H', range(len(CARD_PAIRS)))
+        random.shuffle(self.deck)
+        self.deck_pos = 0
+        self._record("deck", deck=self.deck.tolist())
 
-        self.scores[main_team] += points
+    def apply(self, event: str, f: dict):
+        if event == "join":
+            self.players.append(Player(username=f["username"], team=f["team"]))
+        elif event == "start":
+            self.state = "IN_PROGRESS"
+            self.current_team = "TeamA"
+            self._build_rosters()
+        elif event == "psychic":
+            self.round_number = f["round"]
+            self._set_psychic(f["index"])
+        elif event == "deck":
+            self.deck = array('H', f["deck"])
+            self.deck_pos = 0
+        elif event == "draw":
+            left, right = CARD_PAIRS[f["index"]]
+            self.current_card = Card(CARD_TOPICS[f["index"]], left, right, f["start"], f["end"])
+            self.deck_pos += 1
+        elif event == "clue":
+            self.clue = f["clue"]
+        elif event == "guess":
+            self.guesses[f["team"]] = f["value"]
+        elif event == "score":
+            self.scores[f["team"]] += f["points"]
+        elif event == "next_round":
+            self.next_round()
+        elif event == "end":
+            self.state = "ENDED"
+            self.ended_at = time.monotonic()
 
+    def to_dict(self) -> dict:
+        card = self.current_card
         return {
-            "team_guess": guess,
-            "target_range": f"{start} - {end}",
-            "target_center": center,
-            "points": points,
-            "TeamA": self.scores["TeamA"],
-            "TeamB": self.scores["TeamB"]
+            "game_id": self.game_id,
+            "game_name": self.game_name,
+            "pin": self.pin,
+            "creator": self.creator,
+            "players": [[p.username, p.team, p.is_psychic] for p in self.players],
+            "state": self.state,
+            "deck": self.deck.tolist(),
+            "deck_pos": self.deck_pos,
+            "card": [card.topic, card.left_hint, card.right_hint, card.target_start, card.target_end] if card else None,
+            "clue": self.clue,
+            "scores": [self.scores.TeamA, self.scores.TeamB],
+            "guesses": [self.guesses.TeamA, self.guesses.TeamB],
+            "round_number": self.round_number,
+            "psychic_index": self.psychic_index,
+            "current_team": self.current_team,
+            "lsn": self.lsn
         }
 
-    def next_round(self):
-        self.round_number += 1
-        self.clue = None
-        self.current_card = None
-        self.guesses.clear()
-        self.current_team = "TeamB" if self.current_team == "TeamA" else "TeamA"
-        for p in self.players:
-            p.is_psychic = False
+    @classmethod
+    def from_dict(cls, d: dict, chat_capacity: int = CHAT_CAPACITY) -> "Game":
+        game = cls(game_name=d["game_name"], pin=d["pin"], creator=d["creator"], game_id=d["game_id"],
+                   chat_log=ChatLog(chat_capacity))
+        game.players = [Player(u, team, psychic) for u, team, psychic in d["players"]]
+        game.state = d["state"]
+        game.deck = array('H', d["deck"])
+        game.deck_pos = d["deck_pos"]
+        game.current_card = Card(*d["card"]) if d["card"] else None
+        game.clue = d["clue"]
+        game.scores = TeamPair(*d["scores"])
+        game.guesses = TeamPair(*d["guesses"])
+        game.round_number = d["round_number"]
+        game.current_team = d["current_team"]
+        if game.state != "LOBBY":
+            game._build_rosters()
+            if d["psychic_index"] >= 0:
+                game._set_psychic(d["psychic_index"])
+        game.lsn = d["lsn"]
+        if game.state == "ENDED":
+            game.ended_at = time.monotonic()
+        return game
 
-    def draw_card(self) -> Optional[Card]:
-        if not self.cards:
-            self.generate_default_cards()
-        if not self.cards:
-            return None
-        card = self.cards.pop(0)
-        self.current_card = card
-        return card
+    def summary(self) -> dict:
+        return {
+            "game_id": self.game_id,
+            "game_name": self.game_name,
+            "state": self.state,
+            "players": [p.username for p in self.players],
+            "rounds": self.round_number,
+            "TeamA": self.scores["TeamA"],
+            "TeamB": self.scores["TeamB"]
+        }
 
-    def generate_default_cards(self):
-        card_data = [
-            ("Hot", "Cold"), ("Safe for Work", "Not Safe for Work"), ("Genius", "Stupid"),
-            ("Overrated", "Underrated"), ("Moral", "Immoral"), ("Sweet", "Savory"),
-            ("Introvert", "Extrovert"), ("Realistic", "Fantastical"), ("Mainstream", "Obscure"),
-            ("Casual", "Formal"), ("Cheap", "Expensive"), ("Useful", "Useless"),
-            ("Healthy", "Unhealthy"), ("Modern", "Old-fashioned"), ("Funny", "Serious"),
-            ("Popular", "Unpopular"), ("Love", "Hate"), ("Hard", "Easy"), ("Necessary", "Unnecessary"),
-            ("Cool", "Uncool"), ("Brave", "Cowardly"), ("Messy", "Organized"), ("Cliché", "Original"),
-            ("Common", "Rare"), ("Quiet", "Loud"), ("Bright", "Dark"), ("Good for you", "Bad for you"),
-            ("Overprepared", "Underprepared"), ("Reliable", "Unreliable"), ("Predictable", "Surprising"),
-            ("Big Risk", "No Risk"), ("Fast", "Slow"), ("Public", "Private"), ("Generous", "Greedy"),
-            ("Fiction", "Nonfiction"), ("Simple", "Complicated"), ("Strong", "Weak"), ("Free", "Costly"),
-            ("Honest", "Deceptive"), ("Useful Skill", "Useless Skill"), ("Too Much", "Not Enough"),
-            ("Peaceful", "Chaotic"), ("Fun", "Boring"), ("Soft", "Hard"), ("Natural", "Artificial"),
-            ("Friendly", "Hostile"), ("Optimistic", "Pessimistic"), ("Efficient", "Wasteful"),
-            ("Energetic", "Tired"), ("Dangerous", "Safe"), ("Spicy", "Bland"), ("Big", "Small"),
-            ("Tall", "Wide"), ("Short", "Thin"), ("New", "Ancient"), ("Lame", "Exciting"),
-            ("Sweet", "Bitter"), ("Sour", "Tart"), ("Cool", "Hot"), ("Loud", "Silent"),
-            ("Shy", "Bold"), ("Fancy", "Simple"), ("Plain", "Luxury"), ("Cozy", "Uncomfortable"),
-            ("Icy", "Hot"), ("Grim", "Bright"), ("Happy", "Cheerful"), ("Sad", "Depressing"),
-            ("Dry", "Wet"), ("Weird", "Normal"), ("Basic", "Complex"), ("Creative", "Unimaginative"),
-            ("Grounded", "Flighty"), ("Polished", "Rough"), ("Clean", "Dirty"), ("Delicate", "Rugged"),
-            ("Orderly", "Chaotic"), ("Open-minded", "Close-minded"), ("Passive", "Aggressive"),
-            ("Playful", "Serious"), ("Logical", "Emotional"), ("Literal", "Figurative"),
-            ("Tidy", "Messy"), ("Overt", "Subtle"), ("Routine", "Spontaneous"), ("Hyped", "Chill"),
-            ("Innovative", "Traditional"), ("Digital", "Analog"), ("Organic", "Synthetic"),
-            ("Main Character", "Side Character"), ("Awkward", "Charming"), ("Extinct", "Thriving"),
-            ("Groundbreaking", "Typical"), ("High Effort", "Low Effort"), ("Popular", "Underground"),
-            ("Smart", "Ignorant"), ("Seasoned", "Inexperienced"), ("Overkill", "Underwhelming"),
-            ("Wild", "Tame"), ("Hopeful", "Hopeless"), ("Impressive", "Forgettable"),
-            ("Open", "Closed"), ("Massive", "Tiny"), ("Overconfident", "Insecure"),
-            ("Overdressed", "Underdressed"), ("Powerful", "Powerless"), ("Grounded", "Unrealistic"),
-            ("Bright", "Muted"), ("Talkative", "Quiet"), ("Controversial", "Uncontroversial"),
-            ("Nostalgic", "Futuristic"), ("Altruistic", "Selfish"), ("Cringe", "Cool"),
-            ("Rebellious", "Obedient"), ("Edgy", "Wholesome"), ("Dramatic", "Calm"),
-            ("Silly", "Serious"), ("Heavy", "Light"), ("Warm", "Cool"), ("Sharp", "Dull"),
-            ("Private", "Public"), ("Obvious", "Ambiguous"), ("Literal", "Metaphorical"),
-            ("Edible", "Inedible"), ("Human-made", "Natural"), ("Expected", "Unexpected"),
-            ("Traditional", "Modern"), ("Local", "Global"), ("Impersonal", "Personal"),
-            ("Forgiving", "Grudging"), ("Rigid", "Flexible"), ("Noisy", "Quiet"),
-            ("Urban", "Rural"), ("Safe", "Risky"), ("Imaginative", "Literal"),
-            ("Extravagant", "Minimal"), ("Crowded", "Empty"), ("Exclusive", "Inclusive"),
-            ("Active", "Passive"), ("Fancy", "Plain"), ("Slick", "Clunky"), ("Dense", "Sparse"),
-            ("Expressive", "Reserved"), ("Familiar", "Unfamiliar"), ("Approachable", "Intimidating"),
-            ("Bright", "Dim"), ("Physical", "Digital"), ("Popular", "Niche")
-        ]
-        random.shuffle(card_data)
-        self.cards = [Card(f"{l} vs {r}", l, r, random.randint(1, 15), random.randint(16, 20)) for l, r in card_data]
+    def changes_since(self, version: int) -> List[str]:
+        return [key for key, changed in zip(SYNC_KEYS, self.changed) if changed > version]
 
+    def sync_state(self, keys=SYNC_KEYS) -> Dict[str, str]:
+        card = self.current_card
+        psychic, guesser = self.psychic(), self.guesser()
+        guess = self.guesses.get(self.current_team)
+        state = {
+            "state": self.state,
+            "players": ",".join(f"{p.username}:{p.team}" for p in self.players),
+            "round": str(self.round_number),
+            "team": self.current_team,
+            "psychic": psychic.username if psychic else "",
+            "guesser": guesser.username if guesser else "",
+            "topic": card.topic if card else "",
+            "left": card.left_hint if card else "",
+            "right": card.right_hint if card else "",
+            "clue": self.clue or "",
+            "guess": "" if guess is None else str(guess),
+            "TeamA": str(self.scores.TeamA),
+            "TeamB": str(self.scores.TeamB)
+        }
+        return {key: state[key] for key in keys}
 
     def check_winner(self, point_threshold: int = 10) -> Optional[str]:
         for team, score in self.scores.items():
@@ -195,32 +445,49 @@ class Game:
         return None
 
 class GameManager:
-    def __init__(self):
+    def __init__(self, chat_capacity: int = CHAT_CAPACITY):
         self.games: Dict[str, Game] = {}
+        self.chat_capacity = chat_capacity
+        self.journal: Optional[Callable] = None
+        self.shard: Optional[Tuple[int, int]] = None
         self.lock = Lock()
+        self._by_name: Dict[str, str] = {}
+        self._lobbies: Dict[str, None] = {}
+
+    def _new_game_id(self) -> str:
+        while True:
+            game_id = str(uuid.uuid4())[:8]
+            if self.shard is None or shard_of(game_id, self.shard[1]) == self.shard[0]:
+                return game_id
 
     def create_game(self, game_name: str, pin: str, username: str) -> Optional[Game]:
         with self.lock:
-            for g in self.games.values():
-                if g.game_name == game_name:
-                    return None
+            if game_name in self._by_name:
+                return None
 
-            new_game = Game(game_name=game_name, pin=pin, creator=username)
+            new_game = Game(game_name=game_name, pin=pin, creator=username, game_id=self._new_game_id(),
+                            chat_log=ChatLog(self.chat_capacity))
             new_game.add_player(username, team="TeamA")
             new_game.generate_default_cards()
+            new_game.journal = self.journal
+            new_game._record("create", game_name=game_name, pin=pin, creator=username, deck=new_game.deck.tolist())
             self.games[new_game.game_id] = new_game
+            self._by_name[game_name] = new_game.game_id
+            self._lobbies[new_game.game_id] = None
             return new_game
 
     def join_game(self, game_name: str, pin: str, username: str) -> Optional[Game]:
         with self.lock:
-            for game in self.games.values():
-                if game.game_name == game_name and game.pin == pin:
-                    if any(p.username == username for p in game.players):
-                        return None
-                    team = "TeamB" if sum(p.team == "TeamB" for p in game.players) <= sum(p.team == "TeamA" for p in game.players) else "TeamA"
-                    game.add_player(username, team)
-                    return game
+            game_id = self._by_name.get(game_name)
+            game = self.games.get(game_id) if game_id is not None else None
+        if game is None or game.pin != pin:
             return None
+        with game.lock:
+            if any(p.username == username for p in game.players):
+                return None
+            team = "TeamB" if sum(p.team == "TeamB" for p in game.players) <= sum(p.team == "TeamA" for p in game.players) else "TeamA"
+            game.add_player(username, team)
+            return game
 
     def get_game_by_id(self, game_id: str) -> Optional[Game]:
         with self.lock:
@@ -228,11 +495,39 @@ class GameManager:
 
     def list_games(self) -> List[str]:
         with self.lock:
-            return [game.game_name for game in self.games.values() if game.state == "LOBBY"]
+            return [self.games[game_id].game_name for game_id in self._lobbies]
+
+    def start_game(self, game: Game):
+        game.start_game()
+        with self.lock:
+            self._lobbies.pop(game.game_id, None)
 
     def end_game(self, game_id: str) -> bool:
         with self.lock:
             if game_id in self.games:
                 self.games[game_id].state = "ENDED"
+                self.games[game_id].ended_at = time.monotonic()
+                self.games[game_id]._record("end")
+                self._lobbies.pop(game_id, None)
                 return True
             return False
+
+    def remove_game(self, game_id: str) -> Optional[Game]:
+        with self.lock:
+            game = self.games.pop(game_id, None)
+            if game is not None:
+                if self._by_name.get(game.game_name) == game_id:
+                    del self._by_name[game.game_name]
+                self._lobbies.pop(game_id, None)
+                game.evicted = True
+                game._record("evict")
+            return game
+
+    def restore(self, games: List[Game]):
+        with self.lock:
+            for game in games:
+                game.journal = self.journal
+                self.games[game.game_id] = game
+                self._by_name[game.game_name] = game.game_id
+                if game.state == "LOBBY":
+                    self._lobbies[game.game_id] = None
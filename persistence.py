@@ -0,0 +1,145 @@
+import glob
+import json
+import os
+import threading
+from typing import List
+from model import ChatLog, Game, GameManager, Player
+
+SNAPSHOT = 'snapshot.json'
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, sync_interval: float = 0.05):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.lsn = 0
+        self.records = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._dirty = False
+        self._file = None
+        self._segment = 0
+
+    def _segments(self) -> List[str]:
+        paths = glob.glob(os.path.join(self.directory, 'wal.*.log'))
+        return sorted(paths, key=lambda p: int(p.rsplit('.', 2)[1]))
+
+    def _open_segment(self):
+        self._segment += 1
+        path = os.path.join(self.directory, f'wal.{self._segment}.log')
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def recover(self, manager: GameManager) -> int:
+        games = {}
+        path = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                snap = json.load(f)
+            self.lsn = snap["lsn"]
+            for d in snap["games"]:
+                games[d["game_id"]] = Game.from_dict(d, manager.chat_capacity)
+
+        replayed = 0
+        segments = self._segments()
+        for seg in segments:
+            with open(seg, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        lsn, game_id, event, fields = json.loads(line)
+                    except ValueError:
+                        break
+                    self.lsn = max(self.lsn, lsn)
+                    game = games.get(game_id)
+                    if event == "create":
+                        if game is None:
+                            game = Game(game_name=fields["game_name"], pin=fields["pin"], creator=fields["creator"],
+                                        game_id=game_id, chat_log=ChatLog(manager.chat_capacity))
+                            game.players.append(Player(username=fields["creator"], team="TeamA"))
+                            game.apply("deck", fields)
+                            game.lsn = lsn
+                            games[game_id] = game
+                            replayed += 1
+                        continue
+                    if game is None or lsn <= game.lsn:
+                        continue
+                    if event == "evict":
+                        del games[game_id]
+                    else:
+                        game.apply(event, fields)
+                        game.lsn = lsn
+                    replayed += 1
+
+        if segments:
+            self._segment = int(segments[-1].rsplit('.', 2)[1])
+        manager.restore(list(games.values()))
+        return replayed
+
+    def record(self, game: Game, event: str, fields: dict):
+        with self._lock:
+            self.lsn += 1
+            game.lsn = self.lsn
+            self._file.write(json.dumps([self.lsn, game.game_id, event, fields], separators=(',', ':')) + '\n')
+            self.records += 1
+            if self.sync_interval <= 0:
+                self._sync()
+            else:
+                self._dirty = True
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def sync(self):
+        with self._lock:
+            if self._dirty:
+                self._sync()
+
+    def snapshot(self, manager: GameManager):
+        with self._lock:
+            self._sync()
+            self._file.close()
+            old = self._segments()
+            self._open_segment()
+            lsn = self.lsn
+
+        with manager.lock:
+            games = list(manager.games.values())
+        states = []
+        for game in games:
+            with game.lock:
+                states.append(game.to_dict())
+
+        path = os.path.join(self.directory, SNAPSHOT)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({"lsn": lsn, "games": states}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        for seg in old:
+            os.remove(seg)
+
+    def _run(self, manager: GameManager, snapshot_interval: float):
+        waited = 0.0
+        tick = self.sync_interval if self.sync_interval > 0 else snapshot_interval
+        while not self._stop.wait(tick):
+            self.sync()
+            waited += tick
+            if snapshot_interval > 0 and waited >= snapshot_interval:
+                waited = 0.0
+                self.snapshot(manager)
+
+    def start(self, manager: GameManager, snapshot_interval: float = 300):
+        self._open_segment()
+        manager.journal = self.record
+        for game in list(manager.games.values()):
+            game.journal = self.record
+        if self.sync_interval > 0 or snapshot_interval > 0:
+            threading.Thread(target=self._run, args=(manager, snapshot_interval), daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._sync()
+            self._file.close()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from typing import Callable, Optional
+from model import GameManager
+
+
+def jsonl_archiver(path: str) -> Callable[[dict], None]:
+    lock = threading.Lock()
+
+    def archive(summary: dict):
+        with lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + '\n')
+    return archive
+
+
+class GameReaper:
+    def __init__(self, manager: GameManager, ended_ttl: float = 300, lobby_ttl: float = 1800,
+                 active_ttl: float = 3600, interval: float = 60,
+                 archive: Optional[Callable[[dict], None]] = None):
+        self.manager = manager
+        self.ttls = {"ENDED": ended_ttl, "LOBBY": lobby_ttl, "IN_PROGRESS": active_ttl}
+        self.interval = interval
+        self.archive = archive
+        self.stats = {"runs": 0, "ENDED": 0, "LOBBY": 0, "IN_PROGRESS": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _expired(self, game, now: float) -> bool:
+        ttl = self.ttls.get(game.state)
+        if ttl is None:
+            return False
+        if game.state == "ENDED" and game.ended_at is not None:
+            return now - game.ended_at >= ttl
+        return now - game.last_activity >= ttl
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        if now is None:
+            now = time.monotonic()
+        with self.manager.lock:
+            games = list(self.manager.games.values())
+
+        reclaimed = 0
+        for game in games:
+            if not self._expired(game, now):
+                continue
+            with game.lock:
+                if not self._expired(game, now):
+                    continue
+                state = game.state
+                summary = game.summary() if self.archive else None
+                self.manager.remove_game(game.game_id)
+            if summary is not None:
+                try:
+                    self.archive(summary)
+                except Exception:
+                    pass
+            self.stats[state] += 1
+            reclaimed += 1
+        self.stats["runs"] += 1
+        return reclaimed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.sweep():
+                print(f"Reaped games: {self.stats['ENDED']} ended, {self.stats['LOBBY']} lobbies, "
+                      f"{self.stats['IN_PROGRESS']} in progress so far")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,101 @@
+import secrets
+import time
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+
+class ConnectionRegistry:
+    def __init__(self):
+        self._games: Dict[str, Dict[str, object]] = {}
+        self._lock = Lock()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, game_id: str, username: str, conn):
+        with self._lock:
+            members = self._games.setdefault(game_id, {})
+            if username not in members:
+                self._count += 1
+            members[username] = conn
+
+    def remove(self, game_id: str, username: str, conn=None) -> bool:
+        with self._lock:
+            members = self._games.get(game_id)
+            if not members or username not in members:
+                return False
+            if conn is not None and members[username] is not conn:
+                return False
+            del members[username]
+            self._count -= 1
+            if not members:
+                del self._games[game_id]
+            return True
+
+    def get(self, game_id: str, username: str) -> Optional[object]:
+        members = self._games.get(game_id)
+        return members.get(username) if members else None
+
+    def members(self, game_id: str) -> List[Tuple[str, object]]:
+        with self._lock:
+            members = self._games.get(game_id)
+            return list(members.items()) if members else []
+
+
+class Resumable:
+    __slots__ = ("game_id", "username", "player", "replay", "conn", "detached_at")
+
+    def __init__(self, game_id: str, username: str, player, replay, conn):
+        self.game_id = game_id
+        self.username = username
+        self.player = player
+        self.replay = replay
+        self.conn = conn
+        self.detached_at = None
+
+
+class ResumeTable:
+    def __init__(self, ttl: float = 120):
+        self.ttl = ttl
+        self._sessions: Dict[str, Resumable] = {}
+        self._lock = Lock()
+        self._swept = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def issue(self, game_id: str, username: str, player, replay, conn) -> str:
+        token = secrets.token_hex(12)
+        with self._lock:
+            self._sessions[token] = Resumable(game_id, username, player, replay, conn)
+        return token
+
+    def claim(self, token: str, game_id: str) -> Optional[Resumable]:
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None or entry.game_id != game_id:
+                return None
+            if entry.detached_at is not None and time.monotonic() - entry.detached_at > self.ttl:
+                return None
+            entry.detached_at = None
+            return entry
+
+    def detach(self, token: str, conn, parked) -> bool:
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None or entry.conn is not conn:
+                return False
+            entry.conn = parked
+            entry.detached_at = time.monotonic()
+            return True
+
+    def sweep(self) -> List[Resumable]:
+        # Runs the scan at most once per TTL, so calling it on every disconnect stays cheap.
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept <= self.ttl:
+                return []
+            self._swept = now
+            expired = [t for t, e in self._sessions.items() if e.detached_at is not None and now - e.detached_at > self.ttl]
+            return [self._sessions.pop(t) for t in expired]
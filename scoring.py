@@ -0,0 +1,46 @@
+from typing import Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIAL = 20
+
+
+def center(start: int, end: int) -> int:
+    return (start + end) // 2
+
+
+def score_guess(guess: int, start: int, end: int) -> Tuple[int, int]:
+    mid = center(start, end)
+    if start <= end:
+        in_arc = start <= guess <= end
+    else:
+        in_arc = guess >= start or guess <= end
+
+    if guess == mid:
+        points = 4
+    elif in_arc:
+        points = 3
+    elif abs(guess - mid) % DIAL == 1:
+        points = 2
+    elif abs(guess - mid) % DIAL == 2:
+        points = 1
+    else:
+        points = 0
+    return points, mid
+
+
+def score_batch(guesses: Sequence[int], starts: Sequence[int], ends: Sequence[int]):
+    # Same rules as score_guess over whole arrays; plain lists when NumPy is not installed.
+    if np is None:
+        return [score_guess(g, s, e)[0] for g, s, e in zip(guesses, starts, ends)]
+
+    g = np.asarray(guesses, dtype=np.int64)
+    s = np.asarray(starts, dtype=np.int64)
+    e = np.asarray(ends, dtype=np.int64)
+    mid = (s + e) // 2
+    in_arc = np.where(s <= e, (s <= g) & (g <= e), (g >= s) | (g <= e))
+    off = np.abs(g - mid) % DIAL
+    return np.select([g == mid, in_arc, off == 1, off == 2], [4, 3, 2, 1], 0).astype(np.int8)
@@ -1,245 +1,587 @@
+import argparse
+import asyncio
 import socket
 import threading
+import time
+import uuid
+from contextlib import contextmanager
 from model import GameManager
-from shmessage import shmessage, WAVEREQ
+from shmessage import shmessage, WAVEREQ, CODECS, TEXT, RID, SYNC_KEYS
 from shpdu import shpdu
+from ashpdu import ashpdu
+from registry import ConnectionRegistry, ResumeTable
+from connection import Connection, AsyncConnection, ParkedConnection, ReplayBuffer, POLICIES, DROP
+from reaper import GameReaper, jsonl_archiver
+from persistence import WriteAheadLog
+from metrics import Metrics
+from timerwheel import TimerWheel
 
 HOST = 'localhost'
 PORT = 50000
+OUTBOX_SIZE = 256
+OUTBOX_POLICY = DROP
+CHAT_PAGE = 20
+SYNC_EPOCH = uuid.uuid4().hex[:8]
+RESUME_BUFFER = 64
+PING_INTERVAL = 30
+IDLE_TIMEOUT = 90
 game_manager = GameManager()
-clients = []
+clients = ConnectionRegistry()
+resumes = ResumeTable()
+timers = TimerWheel()
+reaper = None
+_corked = threading.local()
+metrics = Metrics()
+metrics.gauge("games", lambda: len(game_manager.games))
+metrics.gauge("sessions", lambda: len(clients))
+metrics.gauge("connections", lambda: metrics.counters.get("connections.opened", 0) - metrics.counters.get("connections.closed", 0))
 
-def broadcast_to_game(game_id, message):
-    for sock, gid, _ in clients:
-        if gid == game_id:
-            try:
-                shpdu(sock).sendMessage(message)
-            except Exception:
-                pass
+HANDLERS = {}
 
-def send_to_user(username, game_id, message):
-    for sock, gid, user in clients:
-        if gid == game_id and user == username:
-            try:
-                shpdu(sock).sendMessage(message)
-            except Exception:
-                pass
+class Session:
+    def __init__(self, conn):
+        self.conn = conn
+        self.game_id = None
+        self.username = None
+        self.game = None
+        self.player = None
+        self.token = None
+        self.rid = None
+        self.last_seen = time.monotonic()
+        self.timer = None
+
+    def bind(self, game, username, player=None):
+        if player is None:
+            with game.lock:
+                player = next(p for p in game.players if p.username == username)
+        self.player = player
+        self.game = game
+        self.game_id = game.game_id
+        self.username = username
+
+    def resolve(self, game_id):
+        game = self.game
+        if game is not None and game.game_id == game_id and not game.evicted:
+            return game
+        return game_manager.get_game_by_id(game_id)
+
+    def tag(self, message):
+        # The first reply to a request that carried a rid echoes it; later ones go out as-is.
+        if self.rid is None:
+            return message
+        tagged = message.clone()
+        tagged.addValue(RID, self.rid)
+        self.rid = None
+        return tagged
 
-def handle_client(csoc):
-    pdusock = shpdu(csoc)
-    game_id = None
-    username = None
+    def player_in(self, game, username):
+        if game is self.game and username == self.username:
+            return self.player
+        return next((p for p in game.players if p.username == username), None)
+
+def deliver(game_id, username, conn, messages):
+    pending = getattr(_corked, 'pending', None)
+    if pending is not None:
+        pending.setdefault(conn, (game_id, username, []))[2].extend(messages)
+        return
+    try:
+        conn.sendMessages(messages)
+    except Exception:
+        # A resumable player's pushes are already in its replay; disconnect() parks it.
+        if conn.replay is None:
+            clients.remove(game_id, username, conn)
+
+@contextmanager
+def corked():
+    _corked.pending = {}
+    try:
+        yield
+    finally:
+        pending, _corked.pending = _corked.pending, None
+        if metrics.enabled and pending:
+            started = time.perf_counter()
+        for conn, (game_id, username, messages) in pending.items():
+            deliver(game_id, username, conn, messages)
+        if metrics.enabled and pending:
+            metrics.observe("flush.us", (time.perf_counter() - started) * 1e6)
+            metrics.observe("flush.conns", len(pending))
+
+def broadcast_to_game(game_id, message, requester=None):
+    # Inside a handler this only queues onto the cork; the sends themselves are timed as flush.us.
+    members = clients.members(game_id)
+    reply = requester.tag(message) if requester is not None else message
+    for user, conn in members:
+        deliver(game_id, user, conn, [reply if reply is not message and conn is requester.conn else message])
+    if metrics.enabled:
+        metrics.observe("broadcast.fanout", len(members))
+
+def send_to_user(username, game_id, message, requester=None):
+    conn = clients.get(game_id, username)
+    if conn is not None:
+        if requester is not None and conn is requester.conn:
+            message = requester.tag(message)
+        deliver(game_id, username, conn, [message])
+
+def ping_message():
+    ping = shmessage()
+    ping.setType(WAVEREQ.PING)
+    return ping
+
+_PING = ping_message()
+
+def watch(session):
+    # Armed on the first HELO or PING: older clients never answer PINGs, so they are never pinged or timed out.
+    if IDLE_TIMEOUT > 0 and session.timer is None:
+        session.timer = timers.schedule(min(PING_INTERVAL or IDLE_TIMEOUT, IDLE_TIMEOUT), check_idle, session)
+
+def check_idle(session):
+    # One timer per connection; traffic only moves last_seen and the timer re-arms itself from it.
+    conn = session.conn
+    if conn.closed:
+        return
+    idle = time.monotonic() - session.last_seen
+    if idle >= IDLE_TIMEOUT:
+        print(f"Client {session.username} timed out after {idle:.0f}s idle.")
+        if metrics.enabled:
+            metrics.count("connections.timed_out")
+        conn.expire()
+        return
+    if PING_INTERVAL and idle >= PING_INTERVAL:
+        try:
+            conn.sendMessages([_PING], record=False)
+        except Exception:
+            return
+        delay = IDLE_TIMEOUT - idle
+    else:
+        delay = min(PING_INTERVAL or IDLE_TIMEOUT, IDLE_TIMEOUT) - idle
+    session.timer = timers.schedule(delay, check_idle, session)
+
+def disconnect(session):
+    session.conn.close()
+    if session.timer is not None:
+        session.timer.cancel()
+    if metrics.enabled:
+        metrics.count("connections.closed")
+        metrics.count("bytes_in", session.conn.pdusock.bytes_in)
+        metrics.count("bytes_out", session.conn.pdusock.bytes_out)
+    if session.token is not None:
+        parked = ParkedConnection(session.conn.replay)
+        # Under the game lock, so a resume cannot take the entry over between the two updates.
+        with session.game.lock:
+            if resumes.detach(session.token, session.conn, parked):
+                clients.add(session.game_id, session.username, parked)
+            else:
+                clients.remove(session.game_id, session.username, session.conn)
+        for entry in resumes.sweep():
+            clients.remove(entry.game_id, entry.username, entry.conn)
+    else:
+        clients.remove(session.game_id, session.username, session.conn)
+    if session.username is not None:
+        print(f"Client {session.username} disconnected.")
+
+def handles(req_type):
+    def register(fn):
+        HANDLERS[req_type] = fn
+        return fn
+    return register
+
+def failure(req_type, reason):
+    response = shmessage()
+    response.setType(req_type)
+    response.addValue("status", "Failure")
+    response.addValue("reason", reason)
+    return response
+
+def warning(req_type, text):
+    warn = shmessage()
+    warn.setType(req_type)
+    warn.addValue("error", text)
+    return warn
+
+def admit(session, game, username, response):
+    # From here on everything sent to the player is kept for RSUM, starting with this reply.
+    session.bind(game, username)
+    session.conn.replay = ReplayBuffer(RESUME_BUFFER)
+    session.token = resumes.issue(game.game_id, username, session.player, session.conn.replay, session.conn)
+    response.addValue('game_id', game.game_id)
+    response.addValue('token', session.token)
+    clients.add(session.game_id, session.username, session.conn)
+
+@handles(WAVEREQ.CRE8)
+def handle_create(session, msg):
+    username = msg.getValue('username')
+    game = game_manager.create_game(msg.getValue('game_name'), msg.getValue('pin'), username)
+    response = shmessage()
+    response.setType(WAVEREQ.CRE8)
+    response.addValue('status', 'Success' if game else 'Failure')
+    if game:
+        admit(session, game, username, response)
+    return response
+
+@handles(WAVEREQ.JOIN)
+def handle_join(session, msg):
+    username = msg.getValue('username')
+    game = game_manager.join_game(msg.getValue('game_name'), msg.getValue('pin'), username)
+    response = shmessage()
+    response.setType(WAVEREQ.JOIN)
+    response.addValue('status', 'Success' if game else 'Failure')
+    if game:
+        admit(session, game, username, response)
+    return response
+
+@handles(WAVEREQ.RSUM)
+def handle_resume(session, msg):
+    game_id = msg.getValue("game_id")
+    token = msg.getValue("token")
+    entry = resumes.claim(token, game_id) if token else None
+    game = game_manager.get_game_by_id(game_id) if entry else None
+    if game is None:
+        return failure(WAVEREQ.RSUM, "Session expired")
+
+    received = msg.getValue("received")
+    with game.lock:
+        stale = entry.conn
+        entry.conn = session.conn
+        entry.detached_at = None
+        session.bind(game, entry.username, entry.player)
+        session.token = token
+        missed = entry.replay.since(int(received)) if (received or "").isdigit() else None
+        if missed is None:
+            entry.replay = ReplayBuffer(RESUME_BUFFER)
+        session.conn.replay = entry.replay
+        clients.add(game_id, entry.username, session.conn)
+
+        response = shmessage()
+        response.setType(WAVEREQ.RSUM)
+        response.addValue("status", "Success")
+        response.addValue("username", entry.username)
+        response.addValue("version", str(game.version))
+        # A gap means pushes were lost for good; the client starts counting again and should SYNC.
+        response.addValue("gap", "1" if missed is None else "0")
+        response.addValue("replayed", str(len(missed or ())))
+        # The replay is capped by RESUME_BUFFER, not the outbox, so it must not be dropped for its size.
+        session.conn.sendMessages([session.tag(response)] + (missed or []), record=False, bounded=False)
+
+    if stale is not None and stale is not session.conn:
+        stale.close()
+    print(f"Client {entry.username} resumed ({len(missed or ())} pushes replayed).")
+
+@handles(WAVEREQ.GLST)
+def handle_list(session, msg):
+    games = game_manager.list_games()
+    response = shmessage()
+    response.setType(WAVEREQ.GLST)
+    response.addValue("status", "Success")
+    response.addValue("games", ", ".join(games) if games else "No available games")
+    return response
+
+@handles(WAVEREQ.HELO)
+def handle_hello(session, msg):
+    codec = msg.getValue("codec")
+    response = shmessage()
+    response.setType(WAVEREQ.HELO)
+    response.addValue("codec", codec if codec in CODECS else TEXT)
+    session.conn.sendMessages([session.tag(response)], record=False)
+    session.conn.setCodec(response.getValue("codec"))
+    watch(session)
+
+@handles(WAVEREQ.PING)
+def handle_ping(session, msg):
+    watch(session)
+    if msg.getValue("pong") is None:
+        pong = ping_message()
+        pong.addValue("pong", "1")
+        session.conn.sendMessages([session.tag(pong)], record=False)
+
+@handles(WAVEREQ.STAT)
+def handle_stats(session, msg):
+    response = shmessage()
+    response.setType(WAVEREQ.STAT)
+    response.addValue("status", "Success")
+    for k, v in metrics.snapshot().items():
+        response.addValue(k, v)
+    response.addValue("conn.bytes_in", str(session.conn.pdusock.bytes_in))
+    response.addValue("conn.bytes_out", str(session.conn.pdusock.bytes_out))
+    return response
+
+@handles(WAVEREQ.CHAT)
+def handle_chat(session, msg):
+    game_id = msg.getValue("game_id")
+    username = msg.getValue("username")
+    text = msg.getValue("text")
+    response = shmessage()
+    response.setType(WAVEREQ.CHAT)
+    response.addValue("from", username)
+    response.addValue("text", text)
+    game = session.resolve(game_id)
+    if game:
+        response.addValue("seq", str(game.add_chat(username, text)))
+    broadcast_to_game(game_id, response, session)
+
+@handles(WAVEREQ.HIST)
+def handle_history(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.HIST, "Game not found")
+    count = msg.getValue("count") or str(CHAT_PAGE)
+    before = msg.getValue("before")
+    if not count.isdecimal() or not (before is None or before.isdecimal()):
+        return failure(WAVEREQ.HIST, "count and before must be non-negative integers")
+    with game.lock:
+        first, entries = game.chat_log.page(min(int(count), game.chat_log.capacity), int(before) if before else None)
+        latest = game.chat_log.next_seq
+    response = shmessage()
+    response.setType(WAVEREQ.HIST)
+    response.addValue("status", "Success")
+    response.addValue("first", str(first))
+    response.addValue("count", str(len(entries)))
+    response.addValue("next", str(latest))
+    for i, (sender, text) in enumerate(entries):
+        response.addValue(f"from{i}", sender)
+        response.addValue(f"text{i}", text)
+    return response
+
+@handles(WAVEREQ.SYNC)
+def handle_sync(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.SYNC, "Game not found")
+    since = msg.getValue("since")
+    with game.lock:
+        # Versions only mean something within one server run; anything else gets the full state.
+        full = msg.getValue("epoch") != SYNC_EPOCH or not (since or "").isdigit() or int(since) > game.version
+        values = game.sync_state(SYNC_KEYS if full else game.changes_since(int(since)))
+        version = game.version
+    response = shmessage()
+    response.setType(WAVEREQ.SYNC)
+    response.addValue("status", "Success")
+    response.addValue("mode", "full" if full else "delta")
+    response.addValue("epoch", SYNC_EPOCH)
+    response.addValue("version", str(version))
+    for k, v in values.items():
+        response.addValue(k, v)
+    return response
+
+@handles(WAVEREQ.STRT)
+def handle_start(session, msg):
+    game_id = msg.getValue("game_id")
+    game = session.resolve(game_id)
+    if not game:
+        return failure(WAVEREQ.STRT, "Game not found")
+
+    with game.lock:
+        try:
+            game_manager.start_game(game)
+            if len(game.players) != 4:
+                return failure(WAVEREQ.STRT, "Exactly 4 players required to start the game.")
+            teamA_str = " and ".join(p.username for p in game.roster("TeamA"))
+            teamB_str = " and ".join(p.username for p in game.roster("TeamB"))
+
+            game.round_number = 1
+            game.assign_psychic()
+            psychic, guesser = game.psychic(), game.guesser()
+
+            announce = shmessage()
+            announce.setType(WAVEREQ.STRT)
+            announce.addValue("text", f"Teams set. TeamA: {teamA_str} | TeamB: {teamB_str}\nRound 1: {game.current_team}'s turn. Psychic is {psychic.username}, guesser is {guesser.username}")
+            broadcast_to_game(game_id, announce, session)
+        except Exception as e:
+            return failure(WAVEREQ.STRT, str(e))
+
+@handles(WAVEREQ.CARD)
+def handle_card(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.CARD, "Game not found")
+    username = msg.getValue("username")
+    with game.lock:
+        if game.state != "IN_PROGRESS":
+            send_to_user(username, game.game_id, warning(WAVEREQ.CARD, "No round is in progress."), session)
+            return
+        psychic = session.player_in(game, username)
+        if not psychic or not psychic.is_psychic:
+            send_to_user(username, game.game_id, warning(WAVEREQ.CARD, "Only the psychic can draw the card."), session)
+            return
+        card = game.draw_card()
+        if card:
+            pub = shmessage()
+            pub.setType(WAVEREQ.CARD)
+            pub.addValue("topic", card.topic)
+            pub.addValue("left", card.left_hint)
+            pub.addValue("right", card.right_hint)
+            pub.addValue("psychic", username)
+            broadcast_to_game(game.game_id, pub, session)
+
+            secret = shmessage()
+            secret.setType(WAVEREQ.CARD)
+            secret.addValue("target_start", str(card.target_start))
+            secret.addValue("target_end", str(card.target_end))
+            send_to_user(username, game.game_id, secret, session)
+
+@handles(WAVEREQ.CLUE)
+def handle_clue(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.CLUE, "Game not found")
+    psychic = msg.getValue("psychic")
+    with game.lock:
+        if game.state != "IN_PROGRESS":
+            send_to_user(psychic, game.game_id, warning(WAVEREQ.CLUE, "No round is in progress."), session)
+            return
+        player = session.player_in(game, psychic)
+        if not player or not player.is_psychic:
+            send_to_user(psychic, game.game_id, warning(WAVEREQ.CLUE, "\n Only the psychic can submit a clue."), session)
+            return
+        clue = msg.getValue("clue")
+        game.submit_clue(clue, psychic)
+        clue_msg = shmessage()
+        clue_msg.setType(WAVEREQ.CLUE)
+        clue_msg.addValue("clue", clue)
+        broadcast_to_game(game.game_id, clue_msg, session)
+
+@handles(WAVEREQ.GUESS)
+def handle_guess(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.GUESS, "Game not found")
+    username = msg.getValue("username")
+    with game.lock:
+        # A round's guess is scored once: the round is cleared, or the game ended, before the lock drops.
+        if game.state != "IN_PROGRESS" or game.current_card is None:
+            send_to_user(username, game.game_id, warning(WAVEREQ.GUESS, "No round is waiting for a guess."), session)
+            return
+        guesser = game.guesser()
+        if guesser is None or username != guesser.username:
+            send_to_user(username, game.game_id, warning(WAVEREQ.GUESS, "Only the guesser can submit a guess."), session)
+            return
+
+        value = int(msg.getValue("value"))
+        game.submit_guess(game.current_team, value)
+
+        result = game.evaluate_guess()
+        if result:
+            score_msg = shmessage()
+            score_msg.setType(WAVEREQ.SCRB)
+            for k, v in result.items():
+                score_msg.addValue(k, str(v))
+            score_msg.addValue("version", str(game.version))
+            broadcast_to_game(game.game_id, score_msg, session)
+
+        winner = game.check_winner()
+        if winner:
+            end = shmessage()
+            end.setType(WAVEREQ.ENDG)
+            end.addValue("winner", winner)
+            broadcast_to_game(game.game_id, end, session)
+            game_manager.end_game(game.game_id)
+            return
+
+        game.next_round()
+        game.assign_psychic()
+        psychic, guesser = game.psychic(), game.guesser()
+        round_msg = shmessage()
+        round_msg.setType(WAVEREQ.STRT)
+        round_msg.addValue("text", f"Next round! {game.current_team}'s turn. Psychic is {psychic.username}, guesser is {guesser.username}")
+        broadcast_to_game(game.game_id, round_msg, session)
+
+@handles(WAVEREQ.SCRB)
+def handle_scores(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.SCRB, "Game not found")
+    response = shmessage()
+    response.setType(WAVEREQ.SCRB)
+    response.addValue("TeamA", str(game.scores["TeamA"]))
+    response.addValue("TeamB", str(game.scores["TeamB"]))
+    response.addValue("version", str(game.version))
+    return response
+
+@handles(WAVEREQ.ENDG)
+def handle_end(session, msg):
+    game = session.resolve(msg.getValue("game_id"))
+    if not game:
+        return failure(WAVEREQ.ENDG, "Game not found")
+    winner = game.check_winner()
+    response = shmessage()
+    response.setType(WAVEREQ.ENDG)
+    response.addValue("winner", winner if winner else "No winner yet")
+    broadcast_to_game(game.game_id, response, session)
+
+def handle_message(session, msg):
+    session.rid = msg.getValue(RID)
+    handler = HANDLERS.get(msg.getType())
+    if handler is None:
+        response = failure(msg.getType(), "Unsupported request")
+    else:
+        response = handler(session, msg)
+    if response is not None:
+        session.conn.sendMessage(session.tag(response))
+
+def dispatch(session, msg):
+    if not metrics.enabled:
+        with corked():
+            handle_message(session, msg)
+        return
+
+    name = msg.getType().name
+    started = time.perf_counter()
+    try:
+        with corked():
+            handle_message(session, msg)
+    except Exception:
+        metrics.count(f"req.{name}.errors")
+        raise
+    finally:
+        metrics.observe(f"req.{name}.us", (time.perf_counter() - started) * 1e6)
+
+def handle_client(csoc, codec=TEXT, prime=b''):
+    pdusock = shpdu(csoc, codec)
+    if prime:
+        pdusock.feed(prime)
+    serve(Session(Connection(pdusock, OUTBOX_SIZE, OUTBOX_POLICY)))
+
+def serve(session):
+    if metrics.enabled:
+        metrics.count("connections.opened")
 
     try:
         while True:
             try:
-                msg = pdusock.recvMessage()
+                msgs = session.conn.recvMessages()
             except ConnectionResetError:
                 break
+            session.last_seen = time.monotonic()
+            for msg in msgs:
+                dispatch(session, msg)
 
-            req_type = msg.getType()
-            response = shmessage()
-
-            if req_type == WAVEREQ.CRE8:
-                game = game_manager.create_game(
-                    msg.getValue('game_name'),
-                    msg.getValue('pin'),
-                    msg.getValue('username')
-                )
-                response.setType(WAVEREQ.CRE8)
-                response.addValue('status', 'Success' if game else 'Failure')
-                if game:
-                    game_id = game.game_id
-                    username = msg.getValue('username')
-                    response.addValue('game_id', game_id)
-                    clients.append((csoc, game_id, username))
-
-            elif req_type == WAVEREQ.JOIN:
-                game = game_manager.join_game(
-                    msg.getValue('game_name'),
-                    msg.getValue('pin'),
-                    msg.getValue('username')
-                )
-                response.setType(WAVEREQ.JOIN)
-                response.addValue('status', 'Success' if game else 'Failure')
-                if game:
-                    game_id = game.game_id
-                    username = msg.getValue('username')
-                    response.addValue('game_id', game_id)
-                    clients.append((csoc, game_id, username))
-
-            elif req_type == WAVEREQ.GLST:
-                response.setType(WAVEREQ.GLST)
-                games = game_manager.list_games()
-                response.addValue("status", "Success")
-                response.addValue("games", ", ".join(games) if games else "No available games")
-
-            elif req_type == WAVEREQ.CHAT:
-                game_id = msg.getValue("game_id")
-                username = msg.getValue("username")
-                text = msg.getValue("text")
-                response.setType(WAVEREQ.CHAT)
-                response.addValue("from", username)
-                response.addValue("text", text)
-                broadcast_to_game(game_id, response)
-                continue
-
-            elif req_type == WAVEREQ.STRT:
-                game_id = msg.getValue("game_id")
-                game = game_manager.get_game_by_id(game_id)
-                response.setType(WAVEREQ.STRT)
-
-                if game:
-                    try:
-                        game.start_game()
-                        players = game.players
-                        if len(players) != 4:
-                            response.addValue("status", "Failure")
-                            response.addValue("reason", "Exactly 4 players required to start the game.")
-                        else:
-                            teamA = [p.username for p in players if p.team == "TeamA"]
-                            teamB = [p.username for p in players if p.team == "TeamB"]
-                            teamA_str = " and ".join(teamA)
-                            teamB_str = " and ".join(teamB)
-
-                            game.round_number = 1
-                            psychic = game.assign_psychic()
-                            psychic_player = next(p for p in players if p.username == psychic)
-                            guesser = [p.username for p in players if p.team == psychic_player.team and not p.is_psychic][0]
-
-                            announce = shmessage()
-                            announce.setType(WAVEREQ.STRT)
-                            announce.addValue("text", f"Teams set. TeamA: {teamA_str} | TeamB: {teamB_str}\nRound 1: {psychic_player.team}'s turn. Psychic is {psychic}, guesser is {guesser}")
-                            broadcast_to_game(game_id, announce)
-                            continue
-                    except Exception as e:
-                        response.addValue("status", "Failure")
-                        response.addValue("reason", str(e))
-                else:
-                    response.addValue("status", "Failure")
-                    response.addValue("reason", "Game not found")
-
-            elif req_type == WAVEREQ.CARD:
-                game = game_manager.get_game_by_id(msg.getValue("game_id"))
-                username = msg.getValue("username")
-                if game:
-                    psychic = next((p for p in game.players if p.username == username), None)
-                    if not psychic or not psychic.is_psychic:
-                        warn = shmessage()
-                        warn.setType(WAVEREQ.CARD)
-                        warn.addValue("error", "Only the psychic can draw the card.")
-                        send_to_user(username, game.game_id, warn)
-                        continue
-                    card = game.draw_card()
-                    if card:
-                        pub = shmessage()
-                        pub.setType(WAVEREQ.CARD)
-                        pub.addValue("topic", card.topic)
-                        pub.addValue("left", card.left_hint)
-                        pub.addValue("right", card.right_hint)
-                        pub.addValue("psychic", username)
-                        broadcast_to_game(game.game_id, pub)
-
-                        secret = shmessage()
-                        secret.setType(WAVEREQ.CARD)
-                        secret.addValue("target_start", str(card.target_start))
-                        secret.addValue("target_end", str(card.target_end))
-                        send_to_user(username, game.game_id, secret)
-                    continue
-
-            elif req_type == WAVEREQ.CLUE:
-                game = game_manager.get_game_by_id(msg.getValue("game_id"))
-                psychic = msg.getValue("psychic")
-                if game:
-                    player = next((p for p in game.players if p.username == psychic), None)
-                    if not player or not player.is_psychic:
-                        warn = shmessage()
-                        warn.setType(WAVEREQ.CLUE)
-                        warn.addValue("error", "\n Only the psychic can submit a clue.")
-                        send_to_user(psychic, game.game_id, warn)
-                        continue
-                    clue = msg.getValue("clue")
-                    game.submit_clue(clue, psychic)
-                    clue_msg = shmessage()
-                    clue_msg.setType(WAVEREQ.CLUE)
-                    clue_msg.addValue("clue", clue)
-                    broadcast_to_game(game.game_id, clue_msg)
-                    continue
-
-            elif req_type == WAVEREQ.GUESS:
-                game = game_manager.get_game_by_id(msg.getValue("game_id"))
-                username = msg.getValue("username")
-                if game:
-                    psychic_player = next(p for p in game.players if p.is_psychic)
-                    team = psychic_player.team
-                    guesser = next(p for p in game.players if p.team == team and not p.is_psychic)
-                    if username != guesser.username:
-                        warn = shmessage()
-                        warn.setType(WAVEREQ.GUESS)
-                        warn.addValue("error", "Only the guesser can submit a guess.")
-                        send_to_user(username, game.game_id, warn)
-                        continue
-
-                    value = int(msg.getValue("value"))
-                    game.submit_guess(team, value)
-
-                    result = game.evaluate_guess()
-                    if result:
-                        score_msg = shmessage()
-                        score_msg.setType(WAVEREQ.SCRB)
-                        for k, v in result.items():
-                            score_msg.addValue(k, str(v))
-                        broadcast_to_game(game.game_id, score_msg)
-
-                    winner = game.check_winner()
-                    if winner:
-                        end = shmessage()
-                        end.setType(WAVEREQ.ENDG)
-                        end.addValue("winner", winner)
-                        broadcast_to_game(game.game_id, end)
-
-                        continue
-
-                    game.next_round()
-                    new_psychic = game.assign_psychic()
-                    psychic_player = next(p for p in game.players if p.username == new_psychic)
-                    new_guesser = [p.username for p in game.players if p.team == psychic_player.team and not p.is_psychic][0]
-                    round_msg = shmessage()
-                    round_msg.setType(WAVEREQ.STRT)
-                    round_msg.addValue("text", f"Next round! {psychic_player.team}'s turn. Psychic is {new_psychic}, guesser is {new_guesser}")
-                    broadcast_to_game(game.game_id, round_msg)
-                    continue
-
-            elif req_type == WAVEREQ.SCRB:
-                game = game_manager.get_game_by_id(msg.getValue("game_id"))
-                if game:
-                    response.setType(WAVEREQ.SCRB)
-                    response.addValue("TeamA", str(game.scores["TeamA"]))
-                    response.addValue("TeamB", str(game.scores["TeamB"]))
-                    pdusock.sendMessage(response)
-                    continue
-
-            elif req_type == WAVEREQ.ENDG:
-                game = game_manager.get_game_by_id(msg.getValue("game_id"))
-                response.setType(WAVEREQ.ENDG)
-                if game:
-                    winner = game.check_winner()
-                    response.addValue("winner", winner if winner else "No winner yet")
-                    broadcast_to_game(game.game_id, response)
-                    continue
-
-            pdusock.sendMessage(response)
+    except Exception as e:
+        print(f"Client {session.username} error: {e!r}")
+    finally:
+        disconnect(session)
 
-    except Exception:
-        pass
+async def handle_client_async(reader, writer):
+    print(f"Client connected from {writer.get_extra_info('peername')}")
+    session = Session(AsyncConnection(ashpdu(reader, writer), OUTBOX_SIZE, OUTBOX_POLICY))
+    if metrics.enabled:
+        metrics.count("connections.opened")
+
+    try:
+        while True:
+            try:
+                msg = await session.conn.recvMessage()
+            except ConnectionResetError:
+                break
+            session.last_seen = time.monotonic()
+            dispatch(session, msg)
+
+    except Exception as e:
+        print(f"Client {session.username} error: {e!r}")
     finally:
-        pdusock.close()
-        if (csoc, game_id, username) in clients:
-            clients.remove((csoc, game_id, username))
-            print(f"Client {username} disconnected.") 
+        disconnect(session)
 
 
 def run_server():
+    timers.start()
     with socket.socket() as s:
         s.bind((HOST, PORT))
         s.listen()
@@ -249,5 +591,73 @@ def run_server():
             print(f"Client connected from {addr}")
             threading.Thread(target=handle_client, args=(csoc,), daemon=True).start()
 
+async def run_async_server():
+    asyncio.ensure_future(timers.run())
+    server = await asyncio.start_server(handle_client_async, HOST, PORT, backlog=4096)
+    print(f"Server listening on {HOST}:{PORT} (asyncio)")
+    async with server:
+        await server.serve_forever()
+
+def start_services(args, wal_dir=None):
+    if wal_dir:
+        wal = WriteAheadLog(wal_dir, args.fsync_interval)
+        replayed = wal.recover(game_manager)
+        print(f"Recovered {len(game_manager.games)} games ({replayed} log records replayed)")
+        wal.start(game_manager, args.snapshot_interval)
+
+    global reaper
+    reaper = GameReaper(game_manager, args.ended_ttl, args.lobby_ttl, args.active_ttl, args.reap_interval,
+                        jsonl_archiver(args.archive) if args.archive else None)
+    for name in reaper.stats:
+        metrics.gauge(f"reaper.{name.lower()}", lambda name=name: reaper.stats[name])
+    reaper.start()
+
+def configure(args):
+    global PORT, OUTBOX_SIZE, OUTBOX_POLICY, RESUME_BUFFER, PING_INTERVAL, IDLE_TIMEOUT
+    PORT = args.port
+    PING_INTERVAL = args.ping_interval
+    IDLE_TIMEOUT = args.idle_timeout
+    OUTBOX_SIZE = args.queue_size
+    OUTBOX_POLICY = args.slow_policy
+    RESUME_BUFFER = args.resume_buffer
+    resumes.ttl = args.resume_ttl
+    game_manager.chat_capacity = args.chat_capacity
+    metrics.enabled = args.metrics
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread')
+    parser.add_argument('--workers', type=int, default=1, help='run N worker processes, each owning a partition of games (thread mode)')
+    parser.add_argument('--queue-size', type=int, default=OUTBOX_SIZE)
+    parser.add_argument('--slow-policy', choices=POLICIES, default=OUTBOX_POLICY)
+    parser.add_argument('--ping-interval', type=float, default=PING_INTERVAL, help='seconds of silence before the server sends PING; 0 disables')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, help='seconds of silence before a connection is closed; 0 disables')
+    parser.add_argument('--resume-buffer', type=int, default=RESUME_BUFFER, help='messages kept per player for RSUM replay')
+    parser.add_argument('--resume-ttl', type=float, default=resumes.ttl, help='seconds a dropped session stays resumable')
+    parser.add_argument('--metrics', action='store_true', help='collect per-request metrics, served by STAT')
+    parser.add_argument('--chat-capacity', type=int, default=game_manager.chat_capacity)
+    parser.add_argument('--reap-interval', type=float, default=60)
+    parser.add_argument('--ended-ttl', type=float, default=300)
+    parser.add_argument('--lobby-ttl', type=float, default=1800)
+    parser.add_argument('--active-ttl', type=float, default=3600)
+    parser.add_argument('--archive', help='append a JSON summary of each evicted game to this file')
+    parser.add_argument('--wal-dir', help='log game state transitions here and recover from them at startup')
+    parser.add_argument('--fsync-interval', type=float, default=0.05, help='seconds between WAL fsyncs; 0 syncs every record')
+    parser.add_argument('--snapshot-interval', type=float, default=300)
+    args = parser.parse_args()
+    configure(args)
+
+    if args.workers > 1:
+        from cluster import run_cluster
+        run_cluster(args)
+        return
+
+    start_services(args, args.wal_dir)
+    if args.mode == 'async':
+        asyncio.run(run_async_server())
+    else:
+        run_server()
+
 if __name__ == "__main__":
-    run_server()
+    main()
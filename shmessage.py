@@ -1,4 +1,6 @@
+import struct
 from enum import Enum
+from typing import Tuple
 
 class WAVEREQ(Enum):
     CRE8 = 200
@@ -13,6 +15,23 @@ class WAVEREQ(Enum):
     NEXT = 209
     ENDG = 210
     CHAT = 211
+    HELO = 212
+    HIST = 213
+    STAT = 214
+    SYNC = 215
+    RSUM = 216
+    PING = 217
+
+TEXT = 'text'
+BINARY = 'binary'
+CODECS = (TEXT, BINARY)
+RID = 'rid'
+# Game fields a SYNC reply can carry, in the order servers track them.
+SYNC_KEYS = ("state", "players", "round", "team", "psychic", "guesser", "topic", "left", "right", "clue", "guess",
+             "TeamA", "TeamB")
+
+_HDR = struct.Struct('>BH')
+_KV = struct.Struct('>BI')
 
 class shmessage(object):
     PJOIN = '&'
@@ -22,6 +41,7 @@ class shmessage(object):
     def __init__(self):
         self._data = {}
         self._data['type'] = WAVEREQ.CRE8
+        self._frames = {}
 
     def __str__(self) -> str:
         return self.marshal()
@@ -29,19 +49,27 @@ class shmessage(object):
     def reset(self):
         self._data = {}
         self._data['type'] = WAVEREQ.CRE8
+        self._frames.clear()
 
     def setType(self, t):
         self._data['type'] = t
+        self._frames.clear()
 
     def getType(self):
         return self._data['type']
 
     def addValue(self, key: str, value: str):
         self._data[key] = value
+        self._frames.clear()
 
     def getValue(self, key: str) -> str:
         return self._data.get(key, None)
 
+    def clone(self) -> 'shmessage':
+        m = shmessage()
+        m._data = dict(self._data)
+        return m
+
     def marshal(self) -> str:
         pairs = [shmessage.VJOIN.format(k, v) for (k, v) in self._data.items()]
         return shmessage.PJOIN.join(pairs)
@@ -56,4 +84,51 @@ class shmessage(object):
                     enum_str = v.split('.')[-1]
                     self._data['type'] = WAVEREQ[enum_str]
                 else:
-                    self._data[k] = v
\ No newline at end of file
+                    self._data[k] = v
+
+    def marshalBinary(self) -> bytes:
+        out = [b'']
+        n = 0
+        for k, v in self._data.items():
+            if k == 'type':
+                continue
+            kb = k.encode('utf-8')
+            vb = str(v).encode('utf-8')
+            out.append(_KV.pack(len(kb), len(vb)))
+            out.append(kb)
+            out.append(vb)
+            n += 1
+        out[0] = _HDR.pack(self._data['type'].value, n)
+        return b''.join(out)
+
+    def unmarshalBinary(self, d):
+        t, n = _HDR.unpack_from(d, 0)
+        self._data = {'type': WAVEREQ(t)}
+        self._frames.clear()
+        off = _HDR.size
+        for _ in range(n):
+            klen, vlen = _KV.unpack_from(d, off)
+            off += _KV.size
+            k = str(d[off:off + klen], 'utf-8')
+            off += klen
+            self._data[k] = str(d[off:off + vlen], 'utf-8')
+            off += vlen
+
+    def encode(self, codec: str = TEXT) -> bytes:
+        if codec == BINARY:
+            return self.marshalBinary()
+        return self.marshal().encode('utf-8')
+
+    def frame(self, codec: str = TEXT) -> Tuple[bytes, bytes]:
+        f = self._frames.get(codec)
+        if f is None:
+            mdata = self.encode(codec)
+            f = (len(mdata).to_bytes(4, 'big'), mdata)
+            self._frames[codec] = f
+        return f
+
+    def decode(self, d, codec: str = TEXT):
+        if codec == BINARY:
+            self.unmarshalBinary(d)
+        else:
+            self.unmarshal(str(d, 'utf-8'))
\ No newline at end of file
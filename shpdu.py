@@ -1,48 +1,160 @@
 import socket
-from shmessage import shmessage
+from typing import List, Tuple
+from shmessage import shmessage, WAVEREQ, TEXT
+
+RECV_CHUNK = 16384
+IOV_MAX = 1024
 
 
 class shpdu:
-   def __init__(self, comm: socket.socket):
+   def __init__(self, comm: socket.socket, codec: str = TEXT):
        self._sock = comm
+       self.codec = codec
+       self.bytes_in = 0
+       self.bytes_out = 0
+       self._resetBuffer()
+
+
+   def _resetBuffer(self):
+       self._rbuf = bytearray(RECV_CHUNK)
+       self._rview = memoryview(self._rbuf)
+       self._rstart = 0
+       self._rend = 0
+
+
+   def _fill(self):
+       avail = self._rend - self._rstart
+       if avail < 4:
+           need = 4
+       else:
+           need = 4 + int.from_bytes(self._rview[self._rstart:self._rstart + 4], 'big')
+
+       if self._rstart + need > len(self._rbuf):
+           if need > len(self._rbuf):
+               buf = bytearray(max(need, 2 * len(self._rbuf)))
+               buf[:avail] = self._rview[self._rstart:self._rend]
+               self._rbuf = buf
+               self._rview = memoryview(buf)
+           else:
+               self._rbuf[:avail] = self._rbuf[self._rstart:self._rend]
+           self._rstart = 0
+           self._rend = avail
+
+       rsize = self._sock.recv_into(self._rview[self._rend:])
+       if rsize == 0:
+           raise ConnectionResetError()
+       self._rend += rsize
+       self.bytes_in += rsize
+
+
+   def _nextFrame(self):
+       avail = self._rend - self._rstart
+       if avail < 4:
+           return None
+       start = self._rstart + 4
+       size = int.from_bytes(self._rview[self._rstart:start], 'big')
+       if avail < 4 + size:
+           return None
+       self._rstart = start + size
+       return self._rview[start:self._rstart]
+
+
+   def _decode(self, payload) -> shmessage:
+       m = shmessage()
+       m.decode(payload, self.codec)
+       if self._rstart == self._rend:
+           if len(self._rbuf) > RECV_CHUNK:
+               self._resetBuffer()
+           else:
+               self._rstart = self._rend = 0
+       return m
+
 
+   def unread(self) -> bytes:
+       return bytes(self._rview[self._rstart:self._rend])
 
-   def _loopRecv(self, size: int):
-       data = bytearray(size)
-       mv = memoryview(data)
-       while size > 0:
-           rsize = self._sock.recv_into(mv, size)
-           if rsize == 0:
-               raise ConnectionResetError()
-           mv = mv[rsize:]
-           size -= rsize
-       return data
+
+   def feed(self, data: bytes):
+       avail = self._rend - self._rstart
+       buf = bytearray(max(RECV_CHUNK, avail + len(data)))
+       buf[:avail] = self._rview[self._rstart:self._rend]
+       buf[avail:avail + len(data)] = data
+       self._rbuf = buf
+       self._rview = memoryview(buf)
+       self._rstart = 0
+       self._rend = avail + len(data)
+
+
+   def encode(self, mess: shmessage) -> Tuple[bytes, bytes]:
+       return mess.frame(self.codec)
+
+
+   def _sendv(self, bufs: list):
+       if not hasattr(self._sock, 'sendmsg'):
+           data = b''.join(bufs)
+           self._sock.sendall(data)
+           self.bytes_out += len(data)
+           return
+       i = 0
+       while i < len(bufs):
+           sent = self._sock.sendmsg(bufs[i:i + IOV_MAX])
+           self.bytes_out += sent
+           while i < len(bufs) and sent >= len(bufs[i]):
+               sent -= len(bufs[i])
+               i += 1
+           if sent:
+               bufs[i] = memoryview(bufs[i])[sent:]
+
+
+   def sendFrames(self, frames: List[Tuple[bytes, bytes]]):
+       self._sendv([buf for frame in frames for buf in frame])
+
+
+   def sendFrame(self, frame: Tuple[bytes, bytes]):
+       self._sendv(list(frame))
 
 
    def sendMessage(self, mess: shmessage):
-       mdata = mess.marshal().encode('utf-8')
-       size = len(mdata)
-       self._sock.sendall(size.to_bytes(4, 'big') + mdata)
+       self.sendFrame(self.encode(mess))
+
+
+   def sendMessages(self, messes: List[shmessage]):
+       self.sendFrames([self.encode(m) for m in messes])
 
 
    def recvMessage(self) -> shmessage:
-    try:
-        header = self._loopRecv(4)
-        if not header:
-            raise ConnectionResetError("Client disconnected (empty header)")
+       try:
+           payload = self._nextFrame()
+           while payload is None:
+               self._fill()
+               payload = self._nextFrame()
+           return self._decode(payload)
+
+       except (ConnectionResetError, socket.timeout):
+           raise
+       except Exception as e:
+           raise Exception(f'Bad getMessage: {e}')
 
-        size = int.from_bytes(header, 'big')
-        payload = self._loopRecv(size).decode('utf-8')
 
-        m = shmessage()
-        m.unmarshal(payload)
-        return m
+   def recvMessages(self) -> List[shmessage]:
+       # A HELO may switch codecs, so frames buffered behind it wait until it has been handled.
+       msgs = [self.recvMessage()]
+       try:
+           while msgs[-1].getType() != WAVEREQ.HELO:
+               payload = self._nextFrame()
+               if payload is None:
+                   break
+               msgs.append(self._decode(payload))
+       except Exception as e:
+           raise Exception(f'Bad getMessage: {e}')
+       return msgs
 
-    except ConnectionResetError:
-        raise 
-    except Exception as e:
-        raise Exception(f'Bad getMessage: {e}')
 
+   def shutdown(self):
+       try:
+           self._sock.shutdown(socket.SHUT_RDWR)
+       except OSError:
+           pass
 
 
    def close(self):
@@ -0,0 +1,111 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class Timer:
+    __slots__ = ("due", "callback", "args", "cancelled")
+
+    def __init__(self, due: int, callback: Callable, args: tuple):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # Cancelled timers stay in their bucket until it comes round; they are skipped then.
+        self.cancelled = True
+        self.callback = None
+        self.args = ()
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 0.1, bits: int = 6, levels: int = 4):
+        self.tick = tick
+        self.bits = bits
+        self.levels = levels
+        self.pending = 0
+        self._mask = (1 << bits) - 1
+        self._wheels: List[List[List[Timer]]] = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        self._origin = time.monotonic()
+        self._now = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _place(self, timer: Timer):
+        delta = timer.due - self._now
+        if delta <= 0:
+            self._wheels[0][self._now & self._mask].append(timer)
+            return
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)) or level == self.levels - 1:
+                self._wheels[level][(timer.due >> (self.bits * level)) & self._mask].append(timer)
+                return
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        with self._lock:
+            # At least one tick out, so a timer never lands in the bucket being fired.
+            timer = Timer(self._now + max(1, math.ceil(delay / self.tick)), callback, args)
+            self._place(timer)
+            self.pending += 1
+        return timer
+
+    def _step(self) -> List[Timer]:
+        self._now += 1
+        now = self._now
+        for level in range(1, self.levels):
+            if now & ((1 << (self.bits * level)) - 1):
+                break
+            bucket = self._wheels[level][(now >> (self.bits * level)) & self._mask]
+            self._wheels[level][(now >> (self.bits * level)) & self._mask] = []
+            for timer in bucket:
+                if not timer.cancelled:
+                    self._place(timer)
+                else:
+                    self.pending -= 1
+        slot = now & self._mask
+        bucket, self._wheels[0][slot] = self._wheels[0][slot], []
+        due = []
+        for timer in bucket:
+            if timer.cancelled:
+                self.pending -= 1
+            elif timer.due <= now:
+                self.pending -= 1
+                due.append(timer)
+            else:
+                self._wheels[0][slot].append(timer)
+        return due
+
+    def advance(self, now: Optional[float] = None) -> int:
+        target = int(((time.monotonic() if now is None else now) - self._origin) / self.tick)
+        fired = 0
+        while True:
+            with self._lock:
+                if self._now >= target:
+                    return fired
+                due = self._step()
+            for timer in due:
+                if not timer.cancelled:
+                    fired += 1
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception as e:
+                        print(f"Timer callback failed: {e!r}")
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            self.advance()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    async def run(self):
+        # Drives the wheel from an event loop, so callbacks run on the loop thread.
+        while not self._stop.is_set():
+            await asyncio.sleep(self.tick)
+            self.advance()
+
+    def stop(self):
+        self._stop.set()